@@ -0,0 +1,65 @@
+"""Render debug logs written with settings.DEBUG_LOGGING
+
+usage: python3 debug_log_viewer.py log [log ...] [-c channel ...]
+                                   [--since s] [--until s]
+
+Each log is a .snrdbg segment or the path prefix of a logged run, such as
+logs/robot_debug_20190601-120000. Calls from every log are merged in time
+order. --since and --until are seconds from the first logged call.
+"""
+
+import argparse
+import heapq
+import os
+from datetime import datetime
+
+from snr.utils.debug_log import (LOG_EXTENSION, debug_log_segments,
+                                 read_debug_log, render)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render debug logs")
+    parser.add_argument("logs", nargs="+",
+                        help="log segments or path prefixes of logged runs")
+    parser.add_argument("-c", "--channel", action="append",
+                        help="only show this channel, may be repeated")
+    parser.add_argument("--since", type=float, default=None,
+                        help="seconds from the first call to start at")
+    parser.add_argument("--until", type=float, default=None,
+                        help="seconds from the first call to stop at")
+    args = parser.parse_args()
+
+    runs = []
+    for log in args.logs:
+        if log.endswith(LOG_EXTENSION) and os.path.isfile(log):
+            runs.append([log])
+        else:
+            runs.append(debug_log_segments(log))
+    events = heapq.merge(*[read_run(paths) for paths in runs],
+                         key=lambda event: event[0])
+
+    channels = set(args.channel) if args.channel else None
+    start = None
+    for event in events:
+        timestamp, role, pid, thread_id, channel, _, _ = event
+        if start is None:
+            start = timestamp
+        elapsed = timestamp - start
+        if args.since is not None and elapsed < args.since:
+            continue
+        if args.until is not None and elapsed > args.until:
+            break
+        if channels is not None and channel not in channels:
+            continue
+        print("{} {:>10.6f} {} {}:{:x} {}".format(
+            datetime.fromtimestamp(timestamp).strftime("%H:%M:%S.%f"),
+            elapsed, role, pid, thread_id, render(event)))
+
+
+def read_run(paths):
+    for path in paths:
+        yield from read_debug_log(path)
+
+
+if __name__ == "__main__":
+    main()
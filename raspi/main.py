@@ -16,7 +16,9 @@ from snr.comms.serial.factory import SerialFactory
 from snr.comms.sockets.factory import EthernetLink
 from snr.io.controller.factory import ControllerFactory
 from snr.zynq.factory import ZyboFactory
+from snr.asyncio_node import AsyncioNode
 from snr.node import Node
+from snr.replay import ReplayFactory
 from snr.utils.utils import print_exit, print_mode, print_usage
 from snr.utils.debug import Debugger
 from ui.gui.factory import GUIFactory
@@ -35,7 +37,29 @@ def main():
     if "-d" in argv:
         mode = "debug"
 
-    debugger = Debugger()
+    # Replay a recorded datastore log in place of live inputs
+    replay_prefix = None
+    replay_speed = 1.0
+    if "--replay" in argv:
+        i = argv.index("--replay")
+        if i + 1 >= argc:
+            print_usage()
+            print_exit("Improper usage")
+        replay_prefix = argv[i + 1]
+        if "--replay-speed" in argv:
+            i = argv.index("--replay-speed")
+            try:
+                replay_speed = float(argv[i + 1])
+            except (IndexError, ValueError):
+                print_usage()
+                print_exit("Improper usage")
+        # Hardware is simulated while replaying
+        settings.SIMULATE_INPUT = True
+        settings.SIMULATE_SERIAL = True
+        settings.SIMULATE_DMA = True
+
+    debugger = Debugger(role)
+    debugger.install_dump_handlers()
     dbg = debugger.debug
 
     # Connections between devices
@@ -97,12 +121,28 @@ def main():
                       zynq_link
                       ]
 
-    node = Node(debugger, role, mode, components)
+    if replay_prefix is not None:
+        replay_keys = settings.REPLAY_KEYS.get(role, [])
+        # Endpoints producing replayed data are replaced by the replay
+        sources = [(controls_link.client, settings.CONTROLS_DATA_NAME),
+                   (telemetry_link.client, settings.TELEMETRY_DATA_NAME),
+                   (controller, settings.CONTROLS_DATA_NAME)]
+        replaced = [factory for factory, key in sources
+                    if key in replay_keys]
+        components = [c for c in components if c not in replaced]
+        components.append(ReplayFactory(replay_prefix, replay_keys,
+                                        replay_speed))
+
+    if settings.USE_ASYNCIO_NODE:
+        node = AsyncioNode(debugger, role, mode, components)
+    else:
+        node = Node(debugger, role, mode, components)
     # Run the node's loop
     try:
         node.loop()
     except KeyboardInterrupt:
         dbg("framework", "Interrupted by user, exiting")
+        debugger.dump_flight_recorder("KeyboardInterrupt")
     # except Exception:
     #     dbg("framework_error", "main loop caught: {}", ["death"])
 
@@ -2,14 +2,16 @@
 determines axis of thrust and stores state information
 """
 
-from typing import List
+from typing import Callable, List, Union
 
 import settings
 from robot_motors import RobotMotors
 from snr.endpoint import Endpoint
 from snr.factory import Factory
 from snr.node import Node
-from snr.task import SomeTasks, Task, TaskPriority
+from snr.schema import CONTROLS_SCHEMA, Record
+from snr.task import SomeTasks, Task, TaskPriority, TaskProducer
+from snr.trace import TraceContext
 from snr.utils.utils import init_dict
 
 
@@ -43,22 +45,35 @@ class ControlsProcessor(Endpoint):
     Inputs TODO:
         -Mission tools
     """
+    blocking = False  # Handlers only compute
 
     def __init__(self, parent: Node, name: str,
                  input_name: str, output_name: str):
-        self.task_producers = [self.get_new_tasks]
+        # Request controls as often as topside samples the controller
+        self.task_producers = [
+            TaskProducer(self.get_new_tasks,
+                         1 / settings.CONTROLLER_TICK_RATE)
+        ]
         self.task_handlers = {
-            f"process_{settings.CONTROLS_DATA_NAME}": self.task_handler
+            f"process_{settings.CONTROLS_DATA_NAME}": self.task_handler,
+            "controls_expired": self.handle_controls_expired
         }
         super().__init__(parent, name)
         self.datastore = parent.datastore
+        # Process controls as soon as they are received
+        self.datastore.subscribe(settings.CONTROLS_DATA_NAME,
+                                 self.schedule_processing)
+        # Stop the thrusters if controls stop arriving
+        self.datastore.subscribe_expiry(settings.CONTROLS_DATA_NAME,
+                                        self.schedule_stop)
 
         self.motor_control = RobotMotors(parent, "Robot Motor Controller",
                                          input_name, output_name)
 
-        # Input data
-        self.control_input = {}
-        self.previous_cntl_input = {}
+        # Input data, controls records
+        self.control_input = None
+        self.previous_cntl_input = None
+        self.control_trace = None  # Trace of the controls being processed
 
         # Internal data
         self.axis_list = ['x', 'y', 'z', "yaw", "roll"]
@@ -70,9 +85,21 @@ class ControlsProcessor(Endpoint):
         self.previous_buttons = init_dict(self.buttons_list, False)
         # Pitch cannot be acheived with current motor configuration
 
+        # Handler for each field of the controls schema, by field index
+        self.field_handlers = [self.control_handler(key)
+                               for key in CONTROLS_SCHEMA.names]
+
     def get_new_tasks(self) -> SomeTasks:
         return Task("get_controls_data", TaskPriority.high, [])
 
+    def schedule_processing(self, key: str):
+        self.parent.schedule_task(Task(f"process_{key}",
+                                       TaskPriority.high, []))
+
+    def schedule_stop(self, key: str):
+        self.parent.schedule_task(Task("controls_expired",
+                                       TaskPriority.high, []))
+
     def task_handler(self, t: Task) -> SomeTasks:
         # # Get controls input
         # if t.task_type == "TaskType.get_controls":
@@ -86,19 +113,43 @@ class ControlsProcessor(Endpoint):
         # Process controls input
 
         self.dbg("robot_control_event", "Processing control input")
-        controls_data = self.datastore.use(settings.CONTROLS_DATA_NAME)
+        # Never act on controls older than their TTL
+        controls_data = self.datastore.get_if_fresh(
+            settings.CONTROLS_DATA_NAME, settings.CONTROLS_DATA_TTL_S)
+        trace = self.datastore.get_trace(settings.CONTROLS_DATA_NAME)
+        if trace is not None:
+            trace = trace.hop(self.parent.profiler, "process")
         self.dbg("robot_control_verbose", "Control input {}", [controls_data])
-        return self.receive_controls(controls_data)
+        return self.receive_controls(controls_data, trace)
+
+    def handle_controls_expired(self, t: Task) -> SomeTasks:
+        self.dbg("robot_control_warning",
+                 "No controls received for {} s, stopping thrusters",
+                 [settings.CONTROLS_DATA_TTL_S])
+        # Controls received next are all treated as changed
+        self.control_input = None
+        self.previous_cntl_input = None
+        self.control_trace = None
+        self.previous_throttle = init_dict(self.axis_list, 0)
+        self.throttle = init_dict(self.axis_list, 0)
+        # Sent by the motor controller's thread, on its next update
+        self.motor_control.stop()
+        return None
 
     def get_throttle_data(self):
         return self.throttle
 
-    def receive_controls(self, incoming_controls: dict) -> SomeTasks:
+    def receive_controls(self, incoming_controls: Union[Record, dict],
+                         trace: TraceContext = None) -> SomeTasks:
         if incoming_controls is None:
             self.dbg("robot_control_warning", "Received empty controls")
             return None
+        if isinstance(incoming_controls, dict):
+            # Sent as JSON by an older topside, or replayed from a log
+            incoming_controls = CONTROLS_SCHEMA.from_dict(incoming_controls)
         self.previous_cntl_input = self.control_input
         self.control_input = incoming_controls
+        self.control_trace = trace
         task_list = self.process_controls()
         self.dbg("robot_control_event",
               "Processed {} tasks from received controls", [len(task_list)])
@@ -109,22 +160,12 @@ class ControlsProcessor(Endpoint):
         # Collect only new control values
         self.dbg("robot_control_verbose",
               "Processing controls data: {}", [self.control_input])
-        for key in self.control_input.keys():
-            # For each key that is incoming
-            # if self.previous_cntl_input is not None:
-            old_data = self.previous_cntl_input.get(key)
-            # else:
-            #     old_data = None
-            data = self.control_input[key]
-
-            if not data == old_data:
-                # Decide what to do with a control input
-                t = self.handle_control(key, data)
-                if t is not None:
-                    task_list.append(t)
-            else:
-                self.dbg("robot_control_verbose",
-                      "Skipping unchanged value: {}", [data])
+        changed = self.control_input.changed_mask(self.previous_cntl_input)
+        for i, key, data in self.control_input.changed_fields(changed):
+            # Decide what to do with a changed control input
+            handler = self.field_handlers[i]
+            if handler is not None:
+                handler(key, data)
 
         # Batch thrust controls into a tasks afterwards
         throttle_tasks = self.get_throttle_tasks()
@@ -137,20 +178,19 @@ class ControlsProcessor(Endpoint):
               [len(task_list)])
         return task_list
 
-    def handle_control(self, key: str, value) -> SomeTasks:
-        """Deal with individual control buttons from the controller
-        This method takes a key value pair from the control data dict and does
-        the appropriate action for it. For joysticks and triggers, this is
-        means settings a thrust value to be sent to the teensy. For these
-        kinds of control values, process_throttle() is called.
+    def control_handler(self, key: str) -> Union[Callable, None]:
+        """Choose how to deal with a control from the controller
+        This method takes a field of the controls schema and returns the
+        method that performs the appropriate action for its values. For
+        joysticks and triggers, this is means settings a thrust value to be
+        sent to the teensy, so process_throttle() is used.
         """
         # TODO: Create task for different control inputs
-        new_task = None
         if "stick" in key or "trigger" in key:
-            self.process_throttle(key, value)
+            return self.process_throttle
         elif "button" in key:
-            self.process_button(key, value)
-        return new_task
+            return self.process_button
+        return None
 
     def process_throttle(self, key: str, val):
         """Process the value of a single throttle control value
@@ -211,7 +251,8 @@ class ControlsProcessor(Endpoint):
         #         self.previous_throttle[axis] = self.throttle[axis]
         #         task_list.append(t)
         self.motor_control.update_motor_targets(self.get_throttle_data())
-        task_list = self.motor_control.generate_serial_tasks()
+        task_list = self.motor_control.generate_serial_tasks(
+            self.control_trace)
         return task_list
 
     def throttle_value_list(self) -> List[int]:
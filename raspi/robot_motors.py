@@ -40,6 +40,7 @@ from snr.factory import Factory
 from snr.node import Node
 from snr.profiler import Profiler
 from snr.task import SomeTasks, Task, TaskPriority
+from snr.trace import TraceContext
 from snr.utils import debug
 
 # class RobotMotorsFactory(Factory):
@@ -55,10 +56,14 @@ from snr.utils import debug
 
 
 class RobotMotors(AsyncEndpoint):
+    blocking = False  # Ramps motor values, no I/O
+
     def __init__(self, parent: Node, name: str,
                  input_name: str, output_name: str):
 
         self.input_data_name = input_name
+        # Set by stop(), the motors are stopped by the endpoint's own thread
+        self.stop_requested = False
 
         super().__init__(parent, name,
                          self.init_endpoint,
@@ -96,6 +101,10 @@ class RobotMotors(AsyncEndpoint):
         self.motor_targets[5] = axis["x"] + axis["y"] + axis["yaw"]
 
     def update_motor_values(self):
+        if self.stop_requested:
+            self.stop_requested = False
+            self.stop_motors()
+            return
         for index in range(settings.NUM_MOTORS):
             self.motor_previous[index] = self.motor_values[index]
             # New value is within max delta, set new value
@@ -112,18 +121,45 @@ class RobotMotors(AsyncEndpoint):
             else:
                 self.motor_values[index] -= settings.MOTOR_MAX_DELTA
 
-    def generate_serial_tasks(self) -> SomeTasks:
+    def generate_serial_tasks(self, trace: TraceContext = None) -> SomeTasks:
         task_list = []
         for index in range(settings.NUM_MOTORS):
             if not self.motor_values[index] == self.motor_previous[index]:
                 t = Task("serial_com", TaskPriority.high,
-                         ["set_motor", index, self.motor_values[index]])
+                         ("set_motor", index, self.motor_values[index]))
+                t.trace = trace
                 task_list.append(t)
 
         self.dbg("motor_control", "Generated {} serial task(s)", [len(task_list)])
         self.dbg("motor_control_verbose", "{}", [task_list])
         return task_list
 
+    def stop(self) -> SomeTasks:
+        """Stop every motor immediately, without ramping down
+
+        May be called from any thread. The motors are stopped on the next
+        update of the motor values, by the endpoint's own thread.
+        """
+        self.stop_requested = True
+        return None
+
+    def stop_motors(self):
+        """Set every motor to the default value and send it to the motors
+
+        Previous values are set too, so generate_serial_tasks() does not
+        send them again.
+        """
+        task_list = []
+        for index in range(settings.NUM_MOTORS):
+            self.motor_targets[index] = settings.DEFAULT_MOTOR_VALUE
+            self.motor_values[index] = settings.DEFAULT_MOTOR_VALUE
+            self.motor_previous[index] = settings.DEFAULT_MOTOR_VALUE
+            task_list.append(Task("serial_com", TaskPriority.high,
+                                  ("set_motor", index,
+                                   settings.DEFAULT_MOTOR_VALUE)))
+        self.dbg("motor_control", "Stopping {} motors", [len(task_list)])
+        self.parent.schedule_task(task_list)
+
     def terminate(self):
         pass
 
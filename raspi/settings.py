@@ -15,7 +15,14 @@ from snr.comms.sockets.config import SocketsConfig
 # TODO: Track debugging for server and client separately
 DEBUGGING_DELAY_S = 0
 DEBUG_PRINTING = True
-DEBUG_LOGGING = False  # Not yet implemented
+# Log debug() calls to binary files, read them with debug_log_viewer.py
+DEBUG_LOGGING = False
+DEBUG_LOG_DIRECTORY = "logs"
+DEBUG_LOG_SEGMENT_BYTES = 16 * 1024 * 1024  # Log rotates at this size
+DEBUG_LOG_MAX_SEGMENTS = 8  # Oldest segments of a run are deleted
+# Most recent debug() calls on every channel, kept in memory and written to
+# DEBUG_LOG_DIRECTORY on crashes, SIGTERM and SIGUSR1. 0 turns it off
+DEBUG_FLIGHT_RECORDER_SIZE = 4096
 DEBUG_CHANNELS = {
     "camera_verbose": False,
 
@@ -117,11 +124,95 @@ DEBUG_CHANNELS = {
     "throttle_verbose": False,
     "axis_update_verbose": False,
 }
+# Bounds on busy channels, so they can be left on in the field.
+# Channel: (messages per second, burst of messages allowed at once)
+DEBUG_RATE_LIMITS = {
+    "schedule_verbose": (20, 50),
+    "serial_verbose": (20, 50),
+    "robot_control_verbose": (20, 50),
+    "sockets_verbose": (20, 50),
+}
+# Channel: N, only 1 in N messages are printed
+DEBUG_SAMPLE_EVERY = {
+    "schedule_event": 10,
+}
+# How often counts of messages suppressed by the limits are printed
+DEBUG_SUPPRESSED_SUMMARY_S = 5.0
+# Debug lines waiting to be printed, lines are dropped when it is full
+DEBUG_QUEUE_SIZE = 4096
+# Debug lines sent from ProcEndpoint processes that are waiting to be printed
+DEBUG_PROCESS_QUEUE_SIZE = 1024
+# Lines are held this long, so lines from processes are printed in time order
+DEBUG_PROCESS_MERGE_S = 0.05
+# Printed lines are buffered until either threshold is reached
+DEBUG_FLUSH_BYTES = 4096
+DEBUG_FLUSH_S = 0.05
 
 THREAD_END_WAIT_S = 2
+# Period for polling endpoint task producers when the task queue is empty
+TASK_PRODUCER_PERIOD_S = 0.030
+# Seconds a task may wait before it is promoted to the next priority level.
+# Nothing is promoted to high, which is kept for motor commands
+TASK_AGING_S = {
+    "low": 0.250,
+}
+# Task types where a newer queued task replaces an older one with the same
+# values at these val_list indices. serial_com: (command, motor/register)
+TASK_COALESCE_KEYS = {
+    "serial_com": [0, 1],
+}
+# Where handlers for a task type run: "inline" (default) on the main loop,
+# "pool" on a shared thread pool or "lane" on a thread per endpoint.
+# Blocking sockets requests run off the control path.
+TASK_EXECUTORS = {
+    "get_controls_data": "lane",
+    "get_telemetry_data": "lane",
+}
+# Bound on queued tasks. When full, each priority follows its drop policy:
+# "drop_oldest", "reject" the new task or "never_drop"
+TASK_QUEUE_MAX_LEN = 256
+TASK_QUEUE_BACKPRESSURE_LEN = 192  # Producers are deferred at this depth
+TASK_DROP_POLICY = {
+    "high": "never_drop",
+    "normal": "reject",
+    "low": "drop_oldest",
+}
+TASK_POOL_WORKERS = 4
+# Run the Node and its endpoints on one asyncio event loop (AsyncioNode)
+USE_ASYNCIO_NODE = False
+# Work queued for a lagging endpoint past this follows TASK_DROP_POLICY
+TASK_LANE_MAX_PENDING = 4
 DISABLE_SLEEP = False
 ENABLE_PROFILING = True
 PROFILING_AVG_WINDOW_LEN = 64
+# Number of recent values kept for datastore keys, by key
+DATASTORE_HISTORY_LEN = {
+    "controls_data": 64,
+}
+# Keys with only int or float values, their history is kept in an array
+DATASTORE_NUMERIC_KEYS = []
+# Record every datastore write to a binary log for replay and analysis
+RECORD_DATASTORE = False
+RECORDER_DIRECTORY = "logs"
+RECORDER_SEGMENT_BYTES = 64 * 1024 * 1024  # Log rotates at this size
+RECORDER_MAX_SEGMENTS = 32  # Oldest segments of a run are deleted
+RECORDER_FLUSH_S = 0.1  # How often queued writes are encoded
+RECORDER_INDEX_INTERVAL = 256  # Records between seek index entries
+# Keys fed back from a recorded log by main.py --replay, by role.
+# Endpoints that would produce these keys are not started while replaying
+REPLAY_KEYS = {
+    "topside": ["controls_data", "telemetry_data"],
+    "robot": ["controls_data"],
+    "zybo": ["controls_data"],
+}
+REPLAY_EXIT_AT_END = True  # Terminate the node when the log runs out
+# Shared memory datastore for ProcEndpoint processes, created with the first
+# one. Requires Python 3.8, without it their data stays in their process.
+# 0 slots disables it
+SHARED_DATASTORE_SLOTS = 16
+SHARED_DATASTORE_BLOB_SIZE = 256  # Bytes per value
+# Samples kept for latency percentiles, such as traced controls latency
+PROFILING_LATENCY_WINDOW_LEN = 1024
 
 
 # Command Line User Interface
@@ -206,6 +297,9 @@ MAX_SOCKET_SIZE = 8192  # Maximum size for single receiving call
     This timeout should be very long to allow the server to open its socket
     before the client gives up on connecting to it.
 '''
+# Send trace contexts along with sockets data for end to end latency
+# profiling. Must be the same on topside and the robot
+SOCKETS_TRACE_LATENCY = True
 
 # Controls Sockets Connection
 USE_CONTROLS_SOCKETS = True
@@ -217,6 +311,12 @@ CONTROLS_SOCKETS_CONFIG = SocketsConfig(controls_server_ip,
                                         REQUIRE_CONTROLS_SOCKETS)
 
 CONTROLS_DATA_NAME = "controls_data"
+# Thrusters are stopped if controls are not received for this long
+CONTROLS_DATA_TTL_S = 0.5
+# Seconds datastore keys are valid for after being stored, by key
+DATASTORE_TTL_S = {
+    CONTROLS_DATA_NAME: CONTROLS_DATA_TTL_S,
+}
 
 # Telemetry Sockets Connection
 USE_TELEMETRY_SOCKETS = True
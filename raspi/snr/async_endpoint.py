@@ -47,6 +47,11 @@ class AsyncEndpoint(Endpoint):
             self.delay = 1.0 / tick_rate_hz
 
     def start_loop(self):
+        if self.parent and self.parent.start_async_endpoint(self):
+            self.dbg("framework",
+                     "Async endpoint {} loop run by node",
+                     [self.name])
+            return
         self.dbg("framework",
                  "Starting async endpoint {} thread",
                  [self.name])
@@ -60,19 +65,26 @@ class AsyncEndpoint(Endpoint):
         return
 
     def threaded_method(self):
-        self.setup()
-
-        while not self.terminate_flag:
-            if self.profiler is None:
-                self.loop_handler()
-            else:
-                self.profiler.time(self.name, self.loop_handler)
-
-                # self.dbg("profiling_endpoint",
-                #       "Ran {} task in {:6.3f} us",
-                #       [self.name, runtime * 1000000])
-
-            self.tick()
+        try:
+            self.setup()
+
+            while not self.terminate_flag:
+                if self.profiler is None:
+                    self.loop_handler()
+                else:
+                    self.profiler.time(self.name, self.loop_handler)
+
+                    # self.dbg("profiling_endpoint",
+                    #       "Ran {} task in {:6.3f} us",
+                    #       [self.name, runtime * 1000000])
+
+                self.tick()
+        except Exception as error:
+            # threading.excepthook does not see threads from _thread
+            self.parent.debugger.dump_flight_recorder(
+                "unhandled {} in {}: {}".format(
+                    type(error).__name__, self.name, error))
+            raise
 
         self.dbg("framework", "Async endpoint {} exited loop", [self.name])
         self.terminate()
@@ -0,0 +1,116 @@
+"""Endpoint that runs as a coroutine
+
+AsyncioEndpoint subclasses implement setup() and loop_handler() as
+coroutines. Under an AsyncioNode they share the node's event loop. Under the
+threaded Node each one runs its own event loop in a thread.
+"""
+
+import asyncio
+from threading import Thread
+from time import monotonic
+
+from snr.endpoint import Endpoint
+from snr.node import Node
+
+
+class AsyncioEndpoint(Endpoint):
+    """An endpoint driven by a timer on an asyncio event loop
+
+    loop_handler() is awaited according to tick_rate_hz. Handlers must
+    not block, use awaitable I/O such as asyncio streams instead.
+    """
+    blocking = False
+
+    def __init__(self, parent: Node, name: str, tick_rate_hz: float):
+        super().__init__(parent, name)
+        self.terminate_flag = False
+        self.set_delay(tick_rate_hz)
+        self.profiler = parent.profiler
+        self.thread = None
+        self.data_events = {}  # key -> asyncio.Event set on store
+
+    def set_delay(self, tick_rate_hz: float):
+        if tick_rate_hz == 0:
+            self.delay = 0.0
+        else:
+            self.delay = 1.0 / tick_rate_hz
+
+    def start_loop(self):
+        start_coroutine_endpoint = getattr(self.parent,
+                                           "start_coroutine_endpoint", None)
+        if start_coroutine_endpoint is not None:
+            start_coroutine_endpoint(self)
+            return
+        self.dbg("framework",
+                 "Starting asyncio endpoint {} in its own thread",
+                 [self.name])
+        self.thread = Thread(target=self.threaded_method, daemon=True)
+        self.thread.start()
+
+    def threaded_method(self):
+        event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(event_loop)
+        try:
+            event_loop.run_until_complete(self.run())
+        finally:
+            event_loop.close()
+
+    async def run(self):
+        try:
+            await self.setup()
+            next_tick = monotonic()
+            while not self.terminate_flag:
+                start = monotonic()
+                await self.loop_handler()
+                if self.profiler is not None:
+                    self.profiler.log_task(self.name, monotonic() - start)
+
+                # Schedule from the previous tick so the rate does not drift
+                next_tick = max(next_tick + self.delay, monotonic())
+                await asyncio.sleep(next_tick - monotonic())
+        finally:
+            # Also reached when the node cancels the coroutine
+            self.dbg("framework", "Asyncio endpoint {} exited loop",
+                     [self.name])
+            self.terminate()
+
+    async def setup(self):
+        return
+
+    async def loop_handler(self):
+        raise NotImplementedError
+
+    async def wait_data(self, key: str):
+        """Wait for fresh data for key and use it
+
+        Under an AsyncioNode this waits on the node's event loop, otherwise
+        on an event set from the datastore subscription.
+        """
+        wait_for_data = getattr(self.parent, "wait_for_data", None)
+        if wait_for_data is not None:
+            return await wait_for_data(key)
+        datastore = self.parent.datastore
+        event = self.data_events.get(key)
+        if event is None:
+            event = asyncio.Event()
+            self.data_events[key] = event
+            event_loop = asyncio.get_event_loop()
+
+            def on_data_stored(key: str):
+                if not event_loop.is_closed():
+                    event_loop.call_soon_threadsafe(event.set)
+            datastore.subscribe(key, on_data_stored)
+        while not datastore.is_fresh(key):
+            event.clear()
+            if datastore.is_fresh(key):
+                break
+            await event.wait()
+        return datastore.use(key)
+
+    def set_terminate_flag(self):
+        self.terminate_flag = True
+        self.dbg("framework", "Terminating endpoint {}", [self.name])
+
+    def join(self):
+        if self.thread is not None:
+            self.thread.join()
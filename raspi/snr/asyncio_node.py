@@ -0,0 +1,209 @@
+"""Node runtime built on a single asyncio event loop
+
+The task queue, producers and handler dispatch are the same as Node, but
+the main loop is a coroutine. AsyncioEndpoints run as coroutines on the same
+event loop. Existing AsyncEndpoints are adapted and their ticks are asyncio
+timers. Endpoints that do not block, see Endpoint.blocking, run their setup
+and loop handlers on the event loop. Others run them on the event loop's
+default executor, so they only hold a thread while a handler runs.
+
+Tasks whose handlers do not block run on the event loop. Tasks with a
+blocking handler, such as serial writes, are executed on a single handler
+thread while the loop waits for them, so the loop keeps serving endpoint
+coroutines and tasks still run one at a time in order. Threads are only
+started once a blocking handler runs.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from threading import get_ident
+from typing import Union
+
+from snr.node import Node
+from snr.task import Task
+from snr.utils.debug import Debugger
+
+# Most tasks run back to back before endpoint coroutines get to run
+MAX_TASKS_PER_YIELD = 16
+
+
+class AsyncioNode(Node):
+    def __init__(self, debugger: Debugger,
+                 role: str, mode: str,
+                 factories: list):
+        self.event_loop = None
+        # Set when tasks are scheduled or data published
+        self.woken = False
+        self.waiter = None  # Future the main loop waits on to be woken
+        self.wake_timer = None  # Wakes the main loop when a wait times out
+        self.data_events = {}  # key -> asyncio.Event set on store
+        self.coroutines = []  # Endpoint coroutines started by loop()
+        self.loop_thread_id = None
+        # Runs tasks with handlers that may block, one at a time
+        self.handler_thread = ThreadPoolExecutor(max_workers=1)
+        super().__init__(debugger, role, mode, factories)
+
+    def loop(self):
+        self.event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.event_loop)
+        self.loop_thread_id = get_ident()
+        try:
+            self.event_loop.run_until_complete(self.run())
+        finally:
+            self.event_loop.close()
+            self.handler_thread.shutdown(wait=True)
+        self.terminate()
+
+    async def run(self):
+        endpoint_tasks = [self.event_loop.create_task(c)
+                          for c in self.coroutines]
+        self.dbg("framework", "Started {} endpoint coroutines",
+                 [len(endpoint_tasks)])
+
+        ran_count = 0  # Tasks run since endpoint coroutines last ran
+        while not self.terminate_flag:
+            # Cleared before checking so a wakeup while running is not lost
+            self.woken = False
+            if self.producers_due():
+                self.dbg("schedule_event", "Task producers due")
+                self.get_new_tasks()
+            self.datastore.expire()
+            t = self.pop_task()
+            if t is not None:
+                if self.may_block(t):
+                    await self.event_loop.run_in_executor(
+                        self.handler_thread, self.execute_task, t)
+                else:
+                    self.execute_task(t)
+                    ran_count += 1
+                    if ran_count >= MAX_TASKS_PER_YIELD:
+                        # Let endpoint coroutines run between bursts
+                        ran_count = 0
+                        await asyncio.sleep(0)
+                continue
+
+            ran_count = 0
+
+            if not self.producers_due():
+                await self.wait_wakeup(self.wait_timeout())
+
+        for task in endpoint_tasks:
+            task.cancel()
+        await asyncio.gather(*endpoint_tasks, return_exceptions=True)
+
+    async def wait_wakeup(self, timeout: Union[float, None]):
+        """Wait until woken up, or for timeout seconds if it is not None
+
+        A bare future and a timer are cheaper than an asyncio.Event in
+        wait_for(), which wraps the wait in another task. The timer is kept
+        across waits woken early, and only replaced when it would fire late.
+        """
+        if self.woken:
+            return
+        if timeout is not None:
+            when = self.event_loop.time() + timeout
+            timer = self.wake_timer
+            if timer is None or timer.when() > when:
+                if timer is not None:
+                    timer.cancel()
+                self.wake_timer = self.event_loop.call_at(when,
+                                                          self.timed_out)
+        self.waiter = self.event_loop.create_future()
+        try:
+            await self.waiter
+        finally:
+            self.waiter = None
+
+    def timed_out(self):
+        self.wake_timer = None
+        self.wake()
+
+    def wake(self):
+        """Wake the main loop, on the event loop's thread
+        """
+        self.woken = True
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    def may_block(self, t: Task) -> bool:
+        """Whether any handler of the task is a blocking endpoint's
+        """
+        for handlers in (self.task_handlers.get(t.type_id, ()),
+                         self.batch_task_handlers.get(t.type_id, ())):
+            for _, _, endpoint in handlers:
+                if endpoint.blocking:
+                    return True
+        return False
+
+    def notify(self):
+        # Only the event loop waits for tasks, not task_available
+        self.call_on_loop(self.wake)
+
+    def call_on_loop(self, callback):
+        """Call a callback on the event loop from any thread
+        """
+        if self.event_loop is None or self.event_loop.is_closed():
+            return
+        if get_ident() == self.loop_thread_id:
+            # Already on the loop, no need to wake its selector
+            callback()
+        else:
+            self.event_loop.call_soon_threadsafe(callback)
+
+    async def wait_for_data(self, key: str):
+        """Wait until the page for key is fresh, then use it
+        """
+        event = self.data_events.get(key)
+        if event is None:
+            event = asyncio.Event()
+            self.data_events[key] = event
+            self.datastore.subscribe(key, self.on_data_stored)
+        while not self.datastore.is_fresh(key):
+            event.clear()
+            if self.datastore.is_fresh(key):
+                break
+            await event.wait()
+        return self.datastore.use(key)
+
+    def on_data_stored(self, key: str):
+        """Datastore subscriber, may be called from any thread
+        """
+        self.call_on_loop(self.data_events[key].set)
+
+    def start_async_endpoint(self, endpoint) -> bool:
+        self.coroutines.append(self.run_async_endpoint(endpoint))
+        return True
+
+    def start_coroutine_endpoint(self, endpoint) -> bool:
+        """Run an AsyncioEndpoint on the node's event loop
+        """
+        self.coroutines.append(endpoint.run())
+        return True
+
+    async def run_async_endpoint(self, endpoint):
+        """Adapter running a threaded AsyncEndpoint on the event loop
+        """
+        if endpoint.blocking:
+            run = partial(self.event_loop.run_in_executor, None)
+        else:
+            run = run_inline
+        try:
+            await run(endpoint.setup)
+            while not (endpoint.terminate_flag or self.terminate_flag):
+                if endpoint.profiler is None:
+                    await run(endpoint.loop_handler)
+                else:
+                    await run(endpoint.profiler.time,
+                              endpoint.name, endpoint.loop_handler)
+                await asyncio.sleep(endpoint.delay)
+        finally:
+            self.dbg("framework", "Async endpoint {} exited loop",
+                     [endpoint.name])
+            endpoint.terminate()
+
+
+async def run_inline(handler, *args):
+    """Call a handler that does not block on the event loop's thread
+    """
+    return handler(*args)
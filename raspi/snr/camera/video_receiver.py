@@ -90,6 +90,9 @@ class VideoReceiver(ProcEndpoint):
             # Select frames for processing
             if ((self.count % FRAME_SKIP_COUNT) == 0):
                 self.boxes = find_plants.box_image(frame)
+                if self.datastore is not None:
+                    self.datastore.store(f"{self.name}_recvd_frames",
+                                         self.count)
 
             frame = apply_boxes(frame,
                                 self.boxes,
@@ -109,4 +112,5 @@ class VideoReceiver(ProcEndpoint):
 
     def terminate(self):
         cv2.destroyAllWindows()
-        self.parent.datastore.store(f"{self.name}_recvd_frames", self.count)
+        if self.datastore is not None:
+            self.datastore.store(f"{self.name}_recvd_frames", self.count)
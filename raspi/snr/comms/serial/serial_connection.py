@@ -3,7 +3,7 @@ between the Pi and microcontroller
 TODO: Add more documentation here
 """
 
-from typing import Union
+from typing import List, Union
 
 import serial
 
@@ -23,17 +23,25 @@ class SerialConnection(Endpoint):
                  input: str, output: str):
         self.task_producers = []
         self.task_handlers = {
-            "serial_com": self.handle_serial_com,
             "blink_test": self.handle_blink_test
         }
+        # All queued motor commands are sent in one write/read transaction
+        self.batch_task_handlers = {
+            "serial_com": self.handle_serial_com_batch
+        }
         super().__init__(parent, name)
+        self.traced_seq = None  # Trace of the last sample written
+        # Handles for channels debugged for every packet
+        self.serial_verbose = parent.debugger.channel("serial_verbose")
+        self.serial_sim = parent.debugger.channel("serial_sim")
+        self.serial_packet = parent.debugger.channel("serial_packet")
 
         if settings.SIMULATE_SERIAL:
             self.serial_connection = None
             self.simulated_bytes = None
             return
 
-        self.dbg("serial_verbose", "Finding serial port")
+        self.serial_verbose("Finding serial port")
         get_port_to_use(self.set_port)
         self.dbg("serial", "Selected port {}", [self.serial_port])
 
@@ -54,19 +62,27 @@ class SerialConnection(Endpoint):
                 settings.SERIAL_MAX_ATTEMPTS,
                 fail_once, failure)
 
-    def handle_serial_com(self, t: Task):
-        self.dbg("serial_verbose",
-                 "Executing serial com task: {}", [t.val_list])
-        result = self.send_receive(t.val_list[0],
-                                   t.val_list[1::])
-        if result is None:
-            self.dbg("robot",
-                     "Received no data in response from serial message")
-        elif isinstance(result, Task):
-            sched_list.append(result)
-        elif isinstance(result, list):
-            for new_task in list(result):
-                sched_list.append(new_task)
+    def handle_serial_com_batch(self, tasks: List[Task]):
+        self.serial_verbose("Executing {} serial com tasks in one transaction",
+                            [len(tasks)])
+        packets = []
+        for t in tasks:
+            if t.val_list[0].__eq__("read_sensor"):
+                continue
+            p = self.build_packet(t.val_list[0], t.val_list[1::])
+            if p is not None:
+                packets.append(p)
+        if packets:
+            self.send_receive_packets(packets)
+            self.end_traces(tasks)
+
+    def end_traces(self, tasks: List[Task]):
+        """Record glass to thruster latency once for each traced sample
+        """
+        for t in tasks:
+            if t.trace is not None and t.trace.seq != self.traced_seq:
+                self.traced_seq = t.trace.seq
+                t.trace.end(self.parent.profiler, "serial_write")
 
     def handle_blink_test(self, t: Task):
         self.serial_connection.send_receive("blink",
@@ -78,8 +94,7 @@ class SerialConnection(Endpoint):
 
     def try_open_serial(self):
         if settings.SIMULATE_SERIAL:
-            self.dbg("serial_sim",
-                     "Not opening port", [])
+            self.serial_sim("Not opening port", [])
             return None
         sleep(settings.SERIAL_SETUP_WAIT_PRE)
         try:
@@ -112,104 +127,121 @@ class SerialConnection(Endpoint):
     def send_receive(self, cmd_type: str, data: list) -> SomeTasks:
         t = []
 
-        if cmd_type.__eq__("blink"):
-            p = self.new_packet(BLINK_CMD, data[0], data[1])
-
-            self.send_receive_packet(p)
-        elif cmd_type.__eq__("set_motor"):
-            p = self.generate_motor_packet(data[0], data[1])
-
-            self.send_receive_packet(p)
-        elif cmd_type.__eq__("set_cam"):
-            p = self.new_packet(SET_CAM_CMD, data[0], 0)
-            self.send_receive_packet(p)
-        elif cmd_type.__eq__("read_sensor"):
-            pass
-        else:
-            self.dbg("serial_error", "Type of serial command {} not recognized",
-                     [cmd_type])
+        if cmd_type.__eq__("read_sensor"):
+            return t
+        p = self.build_packet(cmd_type, data)
+        if p is None:
             return None
+        self.send_receive_packet(p)
         return t
 
+    def build_packet(self, cmd_type: str, data: list) -> Union[Packet, None]:
+        if cmd_type.__eq__("blink"):
+            return self.new_packet(BLINK_CMD, data[0], data[1])
+        if cmd_type.__eq__("set_motor"):
+            return self.generate_motor_packet(data[0], data[1])
+        if cmd_type.__eq__("set_cam"):
+            return self.new_packet(SET_CAM_CMD, data[0], 0)
+        self.dbg("serial_error", "Type of serial command {} not recognized",
+                 [cmd_type])
+        return None
+
     # Send and receive a serial packet
     def send_receive_packet(self, p: Packet) -> Packet:
         # send packet
         self.write_packet(p)
         # Recieve a packet from the Arduino/Teensy
         p_recv = self.read_packet()
+        self.check_response(p, p_recv)
+        return p
+
+    # Send packets in one write, then read one response per packet
+    def send_receive_packets(self, packets: List[Packet]):
+        data_bytes = b"".join([p.pack()[0] for p in packets])
+        if not self.write_bytes(data_bytes, len(packets) * PACKET_SIZE):
+            return
+        for p in packets:
+            self.check_response(p, self.read_packet())
+
+    def check_response(self, p: Packet, p_recv: Union[Packet, None]):
         if p_recv is None:
-            self.dbg("serial_verbose", "Received an empty packet")
+            self.serial_verbose("Received an empty packet")
         elif p.weak_eq(p_recv):
-            self.dbg("serial_verbose", "Received echo packet")
+            self.serial_verbose("Received echo packet")
         else:
-            self.dbg("serial_verbose", "Received {}", [p_recv])  # Debugging
-        return p
+            self.serial_verbose("Received {}", [p_recv])  # Debugging
 
     # Send a Packet over serial
 
     def write_packet(self, p):
         data_bytes, expected_size = p.pack()
-        self.dbg("serial_verbose", "Trying to send packet of expected size {}",
-                 [expected_size])
+        if self.write_bytes(data_bytes, expected_size):
+            self.serial_verbose("Sent {}", [p])
+
+    def write_bytes(self, data_bytes: bytes, expected_size: int) -> bool:
+        self.serial_verbose("Trying to send packet of expected size {}",
+                            [expected_size])
         sent_bytes = 0
 
         if settings.SIMULATE_SERIAL:
-            self.dbg("serial_sim", "Sending bytes {}", [
+            self.serial_sim("Sending bytes {}", [
                 data_bytes])
+            # Simulated device echoes every packet back
             self.simulated_bytes = data_bytes
-            return
+            return True
 
         try:
             if not self.serial_connection.is_open:
                 self.dbg("serial_error", "Aborting send, Serial is not open: {}",
                          [self.serial_connection])
-                return
+                return False
             sent_bytes += self.serial_connection.write(data_bytes)
-            self.dbg("serial_verbose", "Sent {} bytes: {}",
-                     [sent_bytes, data_bytes])
-            self.dbg("serial_verbose", "Out-waiting: {}",
-                     [self.serial_connection.out_waiting])
+            self.serial_verbose("Sent {} bytes: {}",
+                                [sent_bytes, data_bytes])
+            self.serial_verbose("Out-waiting: {}",
+                                [self.serial_connection.out_waiting])
         except serial.serialutil.SerialException as error:
             self.dbg("serial_error", "Error sending packet: {}",
                      [error.__repr__()])
-            return
-        self.dbg("serial_verbose", "Sent {}", [p])
-        return
+            return False
+        return True
 
     # Read in a packet from serial
     # TODO: ensure that this effectively recieves data over serial
     def read_packet(self) -> Union[Packet, None]:
         if settings.SIMULATE_SERIAL:
-            self.dbg("serial_sim", "Receiving packet of simulated bytes")
-            recv_bytes = self.simulated_bytes
+            self.serial_sim("Receiving packet of simulated bytes")
+            recv_bytes = self.simulated_bytes[:PACKET_SIZE]
+            self.simulated_bytes = self.simulated_bytes[PACKET_SIZE:]
         else:
             if not self.serial_connection.is_open:
                 self.dbg("serial_error", "Aborting read, Serial is not open: {}",
                          [self.serial_connection])
                 return None
 
-            self.dbg("serial_verbose", "Waiting for bytes, {} ready", [
+            self.serial_verbose("Waiting for bytes, {} ready", [
                 self.serial_connection.in_waiting])
             tries = 0
             while self.serial_connection.in_waiting < PACKET_SIZE:
                 tries = tries + 1
-            self.dbg("serial_verbose",
-                     "Received enough bytes after {} tries", [tries])
-            self.dbg("serial_verbose", "Reading, {} bytes ready",
-                     [self.serial_connection.in_waiting])
+            self.serial_verbose("Received enough bytes after {} tries",
+                                [tries])
+            self.serial_verbose("Reading, {} bytes ready",
+                                [self.serial_connection.in_waiting])
             try:
                 recv_bytes = self.serial_connection.read(size=PACKET_SIZE)
             except Exception as error:
                 self.dbg("serial_receive", "Error reading serial: {}",
                          [error.__repr__()])
-        self.dbg("serial_verbose", "Read bytes from serial")
-        self.dbg("serial_verbose", "type(recv_bytes) = {}", [type(recv_bytes)])
         cmd = recv_bytes[0]
         val1 = recv_bytes[1]
         val2 = recv_bytes[2]
-        s = "Unpacked: cmd: {}.{}, val1: {}.{}, val2: {}.{}"
-        self.dbg('serial_verbose', s,
-                 [cmd, cmd.__class__, val1, val1.__class__, val2, val2.__class__])
+        if self.serial_verbose.active:
+            self.serial_verbose("Read bytes from serial")
+            self.serial_verbose("type(recv_bytes) = {}", [type(recv_bytes)])
+            s = "Unpacked: cmd: {}.{}, val1: {}.{}, val2: {}.{}"
+            self.serial_verbose(s, [cmd, cmd.__class__, val1, val1.__class__,
+                                    val2, val2.__class__])
         p = Packet(cmd, val1, val2)
         return p
 
@@ -219,8 +251,8 @@ class SerialConnection(Endpoint):
         if speed < -100:
             return 0
         val = int((speed * 1.275) + 127)
-        self.dbg("serial_packet",
-                 "Converted motor speed from {} to {}", [speed, val])
+        self.serial_packet("Converted motor speed from {} to {}",
+                           [speed, val])
         return val
 
     def generate_motor_packet(self, motor: int, speed: int) -> Packet:
@@ -230,9 +262,8 @@ class SerialConnection(Endpoint):
     def new_packet(self, cmd: int, val1: int, val2: int):
         """ Constructor for building packets to send (chksum is created)
         """
-        self.dbg("serial_verbose",
-                 "Preparing packet: cmd: {}, val1: {}, val2: {}",
-                 [cmd, val1, val2])
+        self.serial_verbose("Preparing packet: cmd: {}, val1: {}, val2: {}",
+                            [cmd, val1, val2])
 
         return Packet(cmd, val1, val2)
 
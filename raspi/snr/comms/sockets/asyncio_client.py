@@ -0,0 +1,141 @@
+""" Non-blocking sockets client for use with an AsyncioNode
+"""
+
+import errno
+import socket
+from time import monotonic
+
+import settings
+from snr.asyncio_endpoint import AsyncioEndpoint
+from snr.comms.sockets.codec import decode
+from snr.comms.sockets.config import SocketsConfig
+from snr.node import Node
+from snr.task import SomeTasks, Task
+
+# Only checks for termination, requests are made by tasks
+CLIENT_TICK_RATE = 1
+
+
+class AsyncioSocketsClient(AsyncioEndpoint):
+    """Sockets client which requests data from a sockets server
+
+    Same protocol as SocketsClient, but each request is a non-blocking
+    socket driven by event loop callbacks, so the task handler only starts
+    it and returns. The socket is watched for reading as soon as it starts
+    connecting, so a request takes a single callback and no transport,
+    task or timer is created. A request task while one is in flight is
+    skipped, the data it would get is no newer, unless the request is
+    older than SOCKETS_CLIENT_TIMEOUT. A failed connection is retried by
+    the next request instead of waiting SOCKETS_RETRY_WAIT.
+    """
+
+    def __init__(self, parent: Node, name: str,
+                 config: SocketsConfig, data_name: str):
+        self.task_producers = []
+        self.task_handlers = {
+            f"get_{data_name}": self.task_handler
+        }
+        super().__init__(parent, f"sockets_server_{data_name}",
+                         CLIENT_TICK_RATE)
+        self.config = config
+        self.data_name = data_name
+        # Resolved once by setup(), resolving runs on an executor thread
+        self.address = None
+        self.s = None  # Socket of the request in flight
+        self.request_time = None  # When the request in flight started
+        self.failed_count = 0
+        self.start_loop()
+
+        self.dbg("sockets_status", "Sockets {} client created",
+                 [self.data_name])
+
+    async def setup(self):
+        try:
+            infos = await self.parent.event_loop.getaddrinfo(
+                *self.config.tuple(),
+                family=socket.AF_INET, type=socket.SOCK_STREAM)
+            self.address = infos[0][4]
+        except OSError as error:
+            self.dbg("sockets_critical", "Cannot resolve server {}: {}",
+                     [self.config.tuple(), error.__repr__()])
+
+    async def loop_handler(self):
+        return
+
+    def task_handler(self, t: Task) -> SomeTasks:
+        # Consumers subscribe to the data name to process what is stored
+        self.parent.call_on_loop(self.start_request)
+        return None
+
+    def start_request(self):
+        if self.s is not None:
+            if (monotonic() - self.request_time <
+                    settings.SOCKETS_CLIENT_TIMEOUT):
+                return
+            self.dbg("sockets_error", "{} sockets request timed out",
+                     [self.data_name])
+            self.close_request()
+        if self.address is None:
+            return
+        self.s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.s.setblocking(False)
+        self.request_time = monotonic()
+        error = self.s.connect_ex(self.address)
+        if error not in (0, errno.EINPROGRESS):
+            self.connect_failed(error)
+            return
+        # A failed connect also makes the socket readable, recv raises
+        self.parent.event_loop.add_reader(self.s.fileno(), self.receive_data)
+
+    def connect_failed(self, error: int):
+        self.failed_count += 1
+        self.dbg("sockets_client", "{} failed to connect to server: {}",
+                 [self.name, OSError(error, errno.errorcode.get(error))])
+        self.close_request()
+
+    def receive_data(self):
+        """Read what the server sends as soon as it accepts
+
+        Like SocketsClient, a single receive of up to MAX_SOCKET_SIZE.
+        """
+        try:
+            data_bytes = self.s.recv(settings.MAX_SOCKET_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except ConnectionRefusedError as error:
+            self.connect_failed(error.errno)
+            return
+        except OSError as error:
+            self.dbg("sockets_error", "Lost {} sockets connection: {}",
+                     [self.data_name, error.__repr__()])
+            self.close_request()
+            return
+        self.close_request()
+        self.dbg("sockets_receive", "{} received data", [self.data_name])
+        self.dbg("sockets_receive_verbose", "Received data: {}",
+                 [data_bytes])
+
+        try:
+            data, trace = decode(data_bytes)
+            if trace is not None:
+                trace = trace.hop(self.parent.profiler, "network")
+            self.dbg("decode_verbose", "Decoded control input: {}", [data])
+            self.parent.datastore.store(self.data_name, data, trace)
+        except ValueError as error:
+            # Includes JSONDecodeError
+            self.dbg("decode_error", "{}", [error])
+
+    def close_request(self):
+        if self.s is None:
+            return
+        event_loop = self.parent.event_loop
+        if not event_loop.is_closed():
+            event_loop.remove_reader(self.s.fileno())
+        self.s.close()
+        self.s = None
+
+    def terminate(self):
+        self.close_request()
+        if self.failed_count > 0:
+            self.dbg("sockets_warning", "{} failed {} connections",
+                     [self.name, self.failed_count])
@@ -0,0 +1,113 @@
+""" Non-blocking sockets server for use with an AsyncioNode
+"""
+
+import asyncio
+import socket
+
+import settings
+from snr.asyncio_endpoint import AsyncioEndpoint
+from snr.comms.sockets.codec import encode
+from snr.comms.sockets.config import SocketsConfig
+from snr.node import Node
+
+# Only checks for termination, connections are served as they arrive
+SERVER_TICK_RATE = 1
+
+
+class AsyncioSocketsServer(AsyncioEndpoint):
+    """Sockets server which sends data to each client as it connects
+
+    Same protocol as SocketsServer, but the listening socket is watched by
+    the event loop instead of blocking a thread in accept(). Each client is
+    served in the one callback that accepts it: the data is sent and the
+    connection closed without creating a transport or a task.
+    """
+
+    def __init__(self, parent: Node,
+                 config: SocketsConfig, data_name: str):
+        self.task_producers = []
+        self.task_handlers = {}
+
+        super().__init__(parent, f"sockets_server_{data_name}",
+                         SERVER_TICK_RATE)
+        self.config = config
+        self.datastore = self.parent.datastore
+        self.data_name = data_name
+        self.listener = None
+        self.start_loop()
+
+    async def setup(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            listener.bind(self.config.tuple())
+            listener.listen(settings.SOCKETS_MAX_CONNECTIONS)
+        except OSError as error:
+            self.dbg("sockets_critical", "Bind failed: {}", [error])
+            listener.close()
+            return
+        listener.setblocking(False)
+        self.listener = listener
+        asyncio.get_event_loop().add_reader(listener.fileno(),
+                                            self.serve_client)
+        self.dbg("sockets_event", "Server now listening on {}",
+                 [self.config.tuple()])
+
+    async def loop_handler(self):
+        return
+
+    def serve_client(self):
+        """Send data to a client as soon as it connects, then close
+        """
+        try:
+            conn, _ = self.listener.accept()
+        except (BlockingIOError, InterruptedError):
+            return  # Another wakeup took the connection
+        except OSError as error:
+            self.dbg("sockets_server", "Accept failed: {}",
+                     [error.__repr__()])
+            return
+        try:
+            data = self.encoded_data()
+            # Never blocks the loop, the reply fits a new socket's buffer
+            conn.setblocking(False)
+            sent = conn.send(data)
+            if sent < len(data):
+                self.dbg("sockets_error", "Sent {} of {} bytes",
+                         [sent, len(data)])
+            else:
+                self.dbg("sockets_verbose", "Data sent")
+        except OSError as error:
+            self.dbg("sockets_server", "Connection failed: {}",
+                     [error.__repr__()])
+        finally:
+            conn.close()
+
+    def encoded_data(self) -> bytes:
+        """The data to send to a client that just connected
+        """
+        data = self.datastore.use(self.data_name)
+        if data is None:
+            self.dbg("sockets_warning", "Data is none for {}", [self.data_name])
+        trace = None
+        if settings.SOCKETS_TRACE_LATENCY:
+            trace = self.trace_hop()
+        return encode(data, trace, self.dbg)
+
+    def trace_hop(self):
+        """Record how long the data waited to be served, if it is traced
+        """
+        trace = self.datastore.get_trace(self.data_name)
+        if trace is None:
+            return None
+        return trace.hop(self.profiler, "serve")
+
+    def terminate(self):
+        if self.listener is not None:
+            event_loop = asyncio.get_event_loop()
+            if not event_loop.is_closed():
+                event_loop.remove_reader(self.listener.fileno())
+            self.listener.close()
+            self.listener = None
+        self.dbg("sockets_warn", "Socket closed")
+
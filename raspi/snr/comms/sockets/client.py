@@ -1,12 +1,11 @@
 """Sockets client which communicates to a sockets server
 """
 
-import json
 import socket
-from json import JSONDecodeError
 from typing import Union
 
 import settings
+from snr.comms.sockets.codec import decode
 from snr.comms.sockets.config import SocketsConfig
 from snr.endpoint import Endpoint
 from snr.node import Node
@@ -45,8 +44,9 @@ class SocketsClient(Endpoint):
     #         return t
 
     def task_handler(self, t: Task) -> SomeTasks:
+        # Consumers subscribe to the data name to process what is stored
         self.request_data()
-        return Task(f"process_{self.data_name}", TaskPriority.high, [])
+        return None
 
     def request_data(self):
         """Main continual entry point for sending data over sockets
@@ -59,17 +59,16 @@ class SocketsClient(Endpoint):
             # TODO: Throw an exception
             return
 
-        data_str = data_bytes.decode()
         try:
-            self.dbg("decode_verbose",
-                  "Decoded bytes as {}: {}",
-                  [data_str.__class__, data_str])
-            data_dict = json.loads(data_str)
-            self.dbg("decode_verbose", "Decoded control input: {}", [data_dict])
-            self.parent.datastore.store(self.data_name, data_dict)
-
-        except JSONDecodeError as error:
-            self.dbg("JSON_Error", "{}", [error])
+            data, trace = decode(data_bytes)
+            if trace is not None:
+                trace = trace.hop(self.parent.profiler, "network")
+            self.dbg("decode_verbose", "Decoded control input: {}", [data])
+            self.parent.datastore.store(self.data_name, data, trace)
+
+        except ValueError as error:
+            # Includes JSONDecodeError
+            self.dbg("decode_error", "{}", [error])
             # TODO: Throw an exception
             return
 
@@ -0,0 +1,77 @@
+"""Encoding of data sent by sockets servers
+
+Schema records are sent packed:
+    header: magic, schema id, whether a trace follows
+    record: the schema's packed fields
+    trace: sequence id, origin and last hop time, if traced
+
+Other data is sent as JSON, wrapped with its trace when
+SOCKETS_TRACE_LATENCY is enabled. JSON never starts with the record magic,
+so receivers accept either encoding. A record with a value its schema cannot
+pack, such as an int outside int16, is sent as the JSON of its dict instead.
+"""
+
+import json
+import struct
+from typing import Callable, Tuple, Union
+
+import settings
+from snr.schema import Record, lookup
+from snr.trace import TraceContext, unwrap, wrap
+
+RECORD_MAGIC = b"\x00R"
+RECORD_HEADER = struct.Struct("=2sI?")
+TRACE = struct.Struct("=Qdd")
+
+
+def encode(data, trace: Union[TraceContext, None],
+           dbg: Callable) -> bytes:
+    if isinstance(data, Record):
+        try:
+            return encode_record(data, trace)
+        except (struct.error, OverflowError) as error:
+            dbg("sockets_warning", "Cannot pack {}, sending JSON: {}",
+                [data, error])
+            data = data.to_dict()
+    if settings.SOCKETS_TRACE_LATENCY:
+        data = wrap(data, trace)
+    return json.dumps(data).encode()
+
+
+def encode_record(record: Record,
+                  trace: Union[TraceContext, None]) -> bytes:
+    traced = trace is not None and settings.SOCKETS_TRACE_LATENCY
+    encoded = (RECORD_HEADER.pack(RECORD_MAGIC, record.schema.id, traced) +
+               record.schema.pack(record))
+    if traced:
+        encoded += TRACE.pack(trace.seq, trace.origin, trace.last)
+    return encoded
+
+
+def decode(data_bytes: bytes) -> Tuple[object, Union[TraceContext, None]]:
+    """Raises ValueError if the data cannot be decoded
+    """
+    if data_bytes.startswith(RECORD_MAGIC):
+        return decode_record(data_bytes)
+    data = json.loads(data_bytes.decode())
+    if settings.SOCKETS_TRACE_LATENCY:
+        return unwrap(data)
+    return data, None
+
+
+def decode_record(data_bytes: bytes) -> Tuple[Record,
+                                               Union[TraceContext, None]]:
+    try:
+        _, schema_id, traced = RECORD_HEADER.unpack_from(data_bytes)
+        schema = lookup(schema_id)
+        if schema is None:
+            raise ValueError(f"Unknown schema id {schema_id}, "
+                             "control mappings differ between nodes")
+        record = schema.unpack(data_bytes, RECORD_HEADER.size)
+        trace = None
+        if traced:
+            trace = TraceContext(*TRACE.unpack_from(
+                data_bytes, RECORD_HEADER.size + schema.size))
+        return record, trace
+    except struct.error as error:
+        raise ValueError(f"Truncated record: {error}")
@@ -1,3 +1,4 @@
+import settings
 from snr.factory import Factory
 from snr.comms.sockets.server import SocketsServer
 from snr.comms.sockets.client import SocketsClient
@@ -26,6 +27,9 @@ class EthServerFactory(Factory):
         config = SocketsConfig(parent.datastore.get("node_ip_address"),
                                self.link.server_port, False)
 
+        if settings.USE_ASYNCIO_NODE:
+            from snr.comms.sockets.asyncio_server import AsyncioSocketsServer
+            return AsyncioSocketsServer(parent, config, self.link.data_name)
         return SocketsServer(parent, config, self.link.data_name)
 
     def __repr__(self):
@@ -40,6 +44,11 @@ class EthClientFactory(Factory):
     def get(self, parent: Node) -> Endpoint:
         config = SocketsConfig(parent.get_remote_ip(),
                                self.link.server_port, False)
+        if settings.USE_ASYNCIO_NODE:
+            from snr.comms.sockets.asyncio_client import AsyncioSocketsClient
+            return AsyncioSocketsClient(
+                parent, f"sockets_client_{self.link.data_name}",
+                config, self.link.data_name)
         return SocketsClient(parent, f"sockets_client_{self.link.data_name}",
                              config, self.link.data_name)
 
@@ -1,11 +1,11 @@
 """ Sockets server for use in topside UI
 """
 
-import json
 import socket
 
 import settings
 from snr.async_endpoint import AsyncEndpoint
+from snr.comms.sockets.codec import encode
 from snr.comms.sockets.config import SocketsConfig
 from snr.utils.utils import sleep
 from snr.node import Node
@@ -100,10 +100,21 @@ class SocketsServer(AsyncEndpoint):
         data = self.datastore.use(self.data_name)
         if data is None:
             self.dbg("sockets_warning", "Data is none for {}", [self.data_name])
-        encoded_data = json.dumps(data).encode()
+        trace = None
+        if settings.SOCKETS_TRACE_LATENCY:
+            trace = self.trace_hop()
+        encoded_data = encode(data, trace, self.dbg)
         self.conn.sendall(encoded_data)
         self.dbg("sockets_verbose", "Data sent")
 
+    def trace_hop(self):
+        """Record how long the data waited to be served, if it is traced
+        """
+        trace = self.datastore.get_trace(self.data_name)
+        if trace is None:
+            return None
+        return trace.hop(self.profiler, "serve")
+
     def close_socket(self):
         # if not settings.USE_SOCKETS:
         #     return
@@ -1,38 +1,172 @@
 """Store a dictionary for a Node
 
-Provides extra information for items in dictionary including freshness
-and previous value
+Provides extra information for items in dictionary including freshness,
+and a history of recent values for keys configured with one
+
+Subscribers to a key are notified after every store to it, so consumers can
+wait for new data instead of polling.
+
+Each page records the monotonic time it was stored and a sequence number
+counting stores to its key. Keys given a time to live are expired when they
+are not stored again within it. The Node calls expire() from its main loop
+and expiry subscribers are notified once per expiry, so consumers such as the
+controls can react to stale data without polling its age.
+
+The datastore is shared by the Node's main loop and endpoint threads. Pages
+are immutable once stored and the dictionary is copied on every write, then
+published by replacing the reference. Readers therefore never block and
+always see whole pages from a consistent snapshot. Writes, including use()
+marking a page unfresh, are serialized by a lock. Histories are updated in
+place, so history queries also take the lock.
 """
 
-from typing import Callable, Any
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, List, Tuple, Union
 from multiprocessing import Manager
+
+from snr.history import History, NumericHistory
 # TODO: Synchronize datastore for multiprocessing
 
 
 class Page:
-    def __init__(self, data):
-        self.fresh = True
+    """A stored value, never modified after it is stored
+    """
+    __slots__ = ("data", "trace", "timestamp", "seq", "fresh")
+
+    def __init__(self, data, trace=None,
+                 timestamp: float = 0.0, seq: int = 0,
+                 fresh: bool = True):
+        self.fresh = fresh
         self.data = data
+        self.trace = trace  # TraceContext of the sample the data came from
+        self.timestamp = timestamp  # monotonic() when stored
+        self.seq = seq  # Number of earlier stores to the key
+
+    def used(self) -> "Page":
+        return Page(self.data, self.trace, self.timestamp, self.seq, False)
 
 
 class Datastore:
-    def __init__(self, dbg: Callable):
+    def __init__(self, dbg: Callable,
+                 history_len: dict = {}, numeric_keys: list = [],
+                 ttl_s: dict = {}, recorder=None):
         self.dbg = dbg
+        self.recorder = recorder  # Recorder logging every store, optional
+        # Key -> tuple of callbacks and events notified after each store
+        self.subscribers = {}
+        # Same for notifications when a key expires
+        self.expiry_subscribers = {}
+        self.ttl_s = ttl_s  # Key -> seconds a page is valid for
+        self.expiry_times = {}  # Key -> monotonic() the key expires at
+        self.next_expiry_time = float("inf")
         # self.sync_manager = Manager()
         # self.database = self.sync_manager.dict()
-        self.database = {}
+        self.database = {}  # Replaced, never mutated, so reads need no lock
+        self.write_lock = Lock()
+        # Key -> ring buffer of recent values, numeric keys use arrays
+        self.histories = {}
+        for key, capacity in history_len.items():
+            if key in numeric_keys:
+                self.histories[key] = NumericHistory(capacity)
+            else:
+                self.histories[key] = History(capacity)
 
-    def store(self, key: str, data):
-        d = self.database
-        try:
-            old_page = d[key]
-            d[key + "_previous"] = old_page
+    def store(self, key: str, data, trace=None):
+        now = monotonic()
+        history = self.histories.get(key)
+        ttl_s = self.ttl_s.get(key)
+        with self.write_lock:
+            old_page = self.database.get(key)
+            if old_page is None:
+                self.dbg("datastore_event", "Adding new key: {}", [key])
+                seq = 0
+            else:
+                seq = old_page.seq + 1
+            d = dict(self.database)
+            d[key] = Page(data, trace, now, seq)
+            self.database = d
+            if self.recorder is not None:
+                # Under the lock so the log has stores in order
+                self.recorder.record(key, now, data)
+            if history is not None:
+                try:
+                    history.append(now, data)
+                except TypeError:
+                    self.dbg("datastore_error",
+                             "Cannot keep non-numeric history for {}: {}",
+                             [key, data])
+            if ttl_s is not None:
+                self.expiry_times[key] = now + ttl_s
+                self.next_expiry_time = min(self.expiry_times.values())
+        for subscriber in self.subscribers.get(key, ()):
+            self.notify(key, subscriber)
+
+    def subscribe(self, key: str, subscriber):
+        """Notify subscriber after every store to key
+
+        A callable subscriber is called with the key on the storing thread,
+        so it should be quick, such as scheduling a task. Otherwise the
+        subscriber is an event, such as a threading.Event, that is set.
+        """
+        with self.write_lock:
+            self.add_subscriber(self.subscribers, key, subscriber)
+
+    def subscribe_expiry(self, key: str, subscriber):
+        """Notify subscriber when key is not stored again within its TTL
 
-        except KeyError:
-            self.dbg("datastore_event", "Adding new key: {}", [key])
+        Subscribers are notified on the Node's main thread.
+        """
+        if key not in self.ttl_s:
+            self.dbg("datastore_warning",
+                     "Key {} has no TTL and will never expire", [key])
+        with self.write_lock:
+            self.add_subscriber(self.expiry_subscribers, key, subscriber)
 
-        d[key] = Page(data)
-        self.database = d
+    def unsubscribe(self, key: str, subscriber):
+        with self.write_lock:
+            for index in [self.subscribers, self.expiry_subscribers]:
+                remaining = tuple(s for s in index.get(key, ())
+                                  if s is not subscriber)
+                if remaining:
+                    index[key] = remaining
+                else:
+                    index.pop(key, None)
+
+    def add_subscriber(self, index: dict, key: str, subscriber):
+        # Replace rather than mutate so a running notification is unaffected
+        index[key] = index.get(key, ()) + (subscriber,)
+
+    def expire(self, now: float = None):
+        """Notify expiry subscribers of keys whose TTL has passed
+        """
+        if now is None:
+            now = monotonic()
+        if now < self.next_expiry_time:
+            return
+        with self.write_lock:
+            expired = [key for key, expiry_time in self.expiry_times.items()
+                       if expiry_time <= now]
+            for key in expired:
+                del self.expiry_times[key]
+            self.next_expiry_time = min(self.expiry_times.values(),
+                                        default=float("inf"))
+        for key in expired:
+            self.dbg("datastore_event", "Key {} expired", [key])
+            for subscriber in self.expiry_subscribers.get(key, ()):
+                self.notify(key, subscriber)
+
+    def notify(self, key: str, subscriber):
+        try:
+            if callable(subscriber):
+                subscriber(key)
+            else:
+                subscriber.set()
+        except Exception as error:
+            # A failing subscriber must not break the endpoint storing data
+            self.dbg("datastore_error",
+                     "Subscriber {} to {} failed: {}",
+                     [subscriber, key, error.__repr__()])
 
     def is_fresh(self, data_type: str) -> bool:
         page = self.database.get(data_type)
@@ -40,6 +174,28 @@ class Datastore:
             return page.fresh
         return False
 
+    def age(self, key: str) -> Union[float, None]:
+        """Seconds since the key was last stored, None if never stored
+        """
+        page = self.database.get(key)
+        if page is None:
+            return None
+        return monotonic() - page.timestamp
+
+    def get_if_fresh(self, key: str, max_age: float):
+        """Get a value only if it was stored within max_age seconds
+        Does not mark the page unfresh.
+        """
+        page = self.database.get(key)
+        if page is None or monotonic() - page.timestamp > max_age:
+            return None
+        return page.data
+
+    def get_page(self, key: str) -> Union[Page, None]:
+        """Get the page for a key, including its timestamp and sequence
+        """
+        return self.database.get(key)
+
     def get(self, key: str):
         """Get a value from the data store without marking it as unfresh
         """
@@ -50,26 +206,72 @@ class Datastore:
             return None
         return page.data
 
+    def history(self, key: str, n: int) -> List[Tuple[float, int, Any]]:
+        """Up to n most recent (monotonic time, seq, value), oldest first
+        """
+        history = self.histories.get(key)
+        if history is None:
+            self.dbg("datastore_error", "No history kept for {}", [key])
+            return []
+        with self.write_lock:
+            return history.history(n)
+
+    def since(self, key: str, t: float) -> List[Tuple[float, int, Any]]:
+        """(monotonic time, seq, value) stored at or after t, oldest first
+        """
+        history = self.histories.get(key)
+        if history is None:
+            self.dbg("datastore_error", "No history kept for {}", [key])
+            return []
+        with self.write_lock:
+            return history.since(t)
+
+    def get_trace(self, key: str):
+        """Get the TraceContext stored with a value, if any
+        """
+        page = self.database.get(key)
+        if page is None:
+            return None
+        return page.trace
+
     def use(self, key: str):
         """Get a value from the datastore and mark it as unfresh/used
+
+        The page returned is the one marked unfresh, even if another thread
+        stores a new page for the key at the same time.
         """
-        try:
-            self.database[key].fresh = False
-        except KeyError:
-            self.dbg("datastore_error",
-                     "Cannot mark unfresh, key {} not found",
-                     [key])
-        return self.get(key)
+        page = self.database.get(key)
+        if page is not None and not page.fresh:
+            return page.data  # Already used, nothing to write
+        with self.write_lock:
+            page = self.database.get(key)
+            if page is None:
+                self.dbg("datastore_error",
+                         "Cannot mark unfresh, key {} not found",
+                         [key])
+                return None
+            if page.fresh:
+                d = dict(self.database)
+                d[key] = page.used()
+                self.database = d
+        return page.data
+
+    def snapshot(self) -> dict:
+        """Consistent view of every page, must not be modified
+        """
+        return self.database
 
     def terminate(self):
         self.dump()
+        if self.recorder is not None:
+            self.recorder.terminate()
         # self.sync_manager.shutdown()
 
     def dump(self):
-        d = self.database
+        d = self.snapshot()
         for k in d.keys():
             self.dbg("datastore_dump", "k: {} v: {}",
-                     [k, self.get(k)])
+                     [k, d[k].data])
 
 # # Sets data with a given key
 # DatastoreSetter = Callable[[str, Any], None]
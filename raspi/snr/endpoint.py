@@ -4,6 +4,11 @@ from snr.utils import debug
 
 
 class Endpoint:
+    # Whether handlers may block, such as on serial or socket I/O. An
+    # AsyncioNode runs handlers of endpoints that do not block on its event
+    # loop instead of on a thread
+    blocking = True
+
     def __init__(self, parent: Node, name: str):
         self.parent = parent
         self.dbg = parent.dbg
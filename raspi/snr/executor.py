@@ -0,0 +1,190 @@
+"""Executors for running Node task handlers
+
+Each task type is assigned an execution mode in settings.TASK_EXECUTORS:
+    inline: run on the Node's main thread (default)
+    pool: run on a thread pool shared by all endpoints
+    lane: run on a thread dedicated to the handling endpoint
+
+Work for a single endpoint always runs in the order it was dispatched. While
+an endpoint has work pending on another thread, its inline work is queued
+behind it instead of running on the main thread.
+
+Each endpoint holds at most max_pending pieces of work. When it is full, the
+work's priority follows the same drop policies as the Node's TaskQueue.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Callable
+
+from snr.task import TaskPriority, task_type_id
+from snr.task_queue import DROP_OLDEST, NEVER_DROP, PRIORITY_ORDER
+
+INLINE = "inline"
+POOL = "pool"
+LANE = "lane"
+
+
+class EndpointLane:
+    """Ordered queue of work for one endpoint
+    """
+
+    def __init__(self, name: str, dbg: Callable, max_pending: int,
+                 drop_policies: dict):
+        self.name = name
+        self.dbg = dbg
+        self.max_pending = max_pending
+        self.drop_policies = drop_policies  # priority name -> drop policy
+        # (work, priority) in the order the work was dispatched
+        self.pending = deque()
+        self.busy = False
+        self.lock = Lock()
+        self.dropped_count = 0
+        self.rejected_count = 0
+        self.thread = None  # Single worker, created on first lane dispatch
+
+    def run(self, work: Callable, priority: TaskPriority,
+            submit: Callable):
+        """Queue work and start draining with submit if the lane is idle
+        """
+        dropped = None
+        start = False
+        with self.lock:
+            accepted = True
+            if len(self.pending) >= self.max_pending:
+                accepted, dropped = self.make_room(priority)
+            if accepted:
+                self.pending.append((work, priority))
+                start = not self.busy
+                self.busy = True
+            else:
+                self.rejected_count += 1
+
+        if dropped is not None:
+            self.dbg("schedule_warning",
+                     "Lane {} full, dropped oldest pending {} work",
+                     [self.name, dropped[1].name])
+        if not accepted:
+            self.dbg("schedule_warning",
+                     "Lane {} full, rejected {} work",
+                     [self.name, priority.name])
+        if start:
+            submit(self.drain)
+
+    def make_room(self, priority: TaskPriority) -> tuple:
+        """Apply the drop policy for work added to a full lane
+
+        Returns whether to accept the work and the pending entry dropped
+        for it, if any.
+        """
+        policy = self.drop_policies.get(priority.name)
+        if policy == DROP_OLDEST:
+            dropped = self.drop_oldest(priority)
+            return dropped is not None, dropped
+        if policy == NEVER_DROP:
+            for p in reversed(PRIORITY_ORDER):
+                if self.drop_policies.get(p.name) == DROP_OLDEST:
+                    dropped = self.drop_oldest(p)
+                    if dropped is not None:
+                        return True, dropped
+            # Accepted even if nothing could be dropped
+            return True, None
+        return False, None
+
+    def drop_oldest(self, priority: TaskPriority):
+        for i, entry in enumerate(self.pending):
+            if entry[1] == priority:
+                del self.pending[i]
+                self.dropped_count += 1
+                return entry
+        return None
+
+    def drain(self):
+        while True:
+            with self.lock:
+                if not self.pending:
+                    self.busy = False
+                    return
+                work, _ = self.pending.popleft()
+            try:
+                work()
+            except Exception as error:
+                # Keep draining, the lane would stay busy forever otherwise
+                self.dbg("schedule_warning", "Lane {} work raised: {}",
+                         [self.name, error.__repr__()])
+
+    def idle(self) -> bool:
+        return not self.busy
+
+    def get_thread(self) -> ThreadPoolExecutor:
+        if self.thread is None:
+            self.thread = ThreadPoolExecutor(max_workers=1)
+        return self.thread
+
+
+class TaskExecutor:
+    def __init__(self, dbg: Callable, modes: dict,
+                 pool_workers: int, max_pending: int,
+                 drop_policies: dict):
+        self.dbg = dbg
+        # Task type id -> execution mode
+        self.modes = {task_type_id(task_type): mode
+                      for task_type, mode in modes.items()}
+        self.pool_workers = pool_workers
+        self.max_pending = max_pending
+        self.drop_policies = drop_policies
+        self.pool = None  # Shared pool, created on first pool dispatch
+        self.lanes = {}  # endpoint -> EndpointLane
+
+    def mode(self, type_id: int) -> str:
+        return self.modes.get(type_id, INLINE)
+
+    def runs_inline(self, type_id: int, endpoint) -> bool:
+        """Whether work can run immediately on the calling thread
+        """
+        if not endpoint.blocking:
+            return True  # Nothing to keep off the calling thread
+        if self.mode(type_id) != INLINE:
+            return False
+        lane = self.lanes.get(endpoint)
+        return lane is None or lane.idle()
+
+    def dispatch(self, type_id: int, endpoint, priority: TaskPriority,
+                 work: Callable):
+        """Run work off the calling thread, in order for the endpoint
+        """
+        lane = self.lanes.get(endpoint)
+        if lane is None:
+            lane = EndpointLane(endpoint.name, self.dbg, self.max_pending,
+                                self.drop_policies)
+            self.lanes[endpoint] = lane
+
+        if self.mode(type_id) == LANE:
+            submit = lane.get_thread().submit
+        else:
+            # Inline work queued behind busy lanes also goes to the pool
+            submit = self.get_pool().submit
+        lane.run(work, priority, submit)
+
+    def get_pool(self) -> ThreadPoolExecutor:
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(max_workers=self.pool_workers)
+        return self.pool
+
+    def terminate(self):
+        """Drop queued work and wait for running work to finish
+        """
+        for lane in self.lanes.values():
+            with lane.lock:
+                lane.pending.clear()
+        for lane in self.lanes.values():
+            if lane.thread is not None:
+                lane.thread.shutdown(wait=True)
+            if lane.dropped_count > 0 or lane.rejected_count > 0:
+                self.dbg("schedule_warning",
+                         "Lane {} dropped {} and rejected {} pending tasks",
+                         [lane.name, lane.dropped_count,
+                          lane.rejected_count])
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
@@ -0,0 +1,67 @@
+"""Fixed capacity ring buffers of recent values for Datastore keys
+
+Each entry is a (timestamp, sequence number, value) tuple. Timestamps are
+time.monotonic() and sequence numbers count every value appended to the
+history, so gaps show how many values have been overwritten.
+
+History keeps values in a list. NumericHistory keeps them in an array of
+doubles so telemetry keys do not hold a Python object per sample.
+"""
+
+from array import array
+from typing import List, Tuple
+
+
+class History:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.times = array("d", bytes(8 * capacity))
+        self.seqs = array("Q", bytes(8 * capacity))
+        self.values = self.new_values()
+        self.count = 0  # Values appended, the next value's sequence number
+
+    def new_values(self):
+        return [None] * self.capacity
+
+    def append(self, timestamp: float, value):
+        i = self.count % self.capacity
+        # First, so a value a NumericHistory rejects leaves the entry intact
+        self.values[i] = value
+        self.times[i] = timestamp
+        self.seqs[i] = self.count
+        self.count += 1
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def entry(self, k: int) -> Tuple[float, int, object]:
+        """Get the kth oldest entry still held
+        """
+        i = (self.count - len(self) + k) % self.capacity
+        return self.times[i], self.seqs[i], self.values[i]
+
+    def history(self, n: int) -> List[Tuple[float, int, object]]:
+        """Up to n most recent entries, oldest first
+        """
+        size = len(self)
+        return [self.entry(k) for k in range(max(size - n, 0), size)]
+
+    def since(self, timestamp: float) -> List[Tuple[float, int, object]]:
+        """Entries stored at or after timestamp, oldest first
+        """
+        # Binary search for the first entry at or after timestamp
+        size = len(self)
+        start = self.count - size
+        low, high = 0, size
+        while low < high:
+            mid = (low + high) // 2
+            if self.times[(start + mid) % self.capacity] < timestamp:
+                low = mid + 1
+            else:
+                high = mid
+        return [self.entry(k) for k in range(low, size)]
+
+
+class NumericHistory(History):
+    def new_values(self):
+        return array("d", bytes(8 * self.capacity))
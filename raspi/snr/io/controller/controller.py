@@ -4,6 +4,7 @@ https://www.pygame.org/docs/ref/joystick.html
 """
 
 import random
+from time import time
 from typing import Tuple, Union
 
 # import pygame
@@ -11,11 +12,15 @@ from typing import Tuple, Union
 import settings
 from snr.async_endpoint import AsyncEndpoint
 from snr.node import Node
+from snr.schema import CONTROLS_SCHEMA, Record
 from snr.task import SomeTasks
+from snr.trace import TraceContext
 from snr.utils import debug
 
 
 class Controller(AsyncEndpoint):
+    blocking = False  # The joystick is polled, reading it does not wait
+
     def __init__(self, parent: Node,
                  name: str):
         if not settings.USE_CONTROLLER:
@@ -38,12 +43,14 @@ class Controller(AsyncEndpoint):
         # zeroed
         self.triggers_zeroed = not settings.CONTROLLER_ZERO_TRIGGERS
         self.joystick_data = {}
+        # Sequence id of the trace for the next sample
+        self.trace_seq = 0
 
         self.start_loop()
 
-    def store_data(self, data):
+    def store_data(self, data, trace: TraceContext = None):
         # self.dbg("controller", "taking in data")
-        self.datastore.store(self.name, data)
+        self.datastore.store(self.name, data, trace)
 
     def init_controller(self):
         if settings.SIMULATE_INPUT:
@@ -72,6 +79,9 @@ class Controller(AsyncEndpoint):
             return
 
     def monitor_controller(self):
+        # Latency of this sample is traced from when the stick is read
+        trace = TraceContext(self.trace_seq, time())
+        self.trace_seq += 1
         if settings.SIMULATE_INPUT:
             self.dbg("controller_event", "Simulating input")
             joystick_data = self.simulate_input()
@@ -98,19 +108,23 @@ class Controller(AsyncEndpoint):
                              [num_controllers])
                     raise Exception("Lost connection to controller")
         new_data = self.map_input_dict(joystick_data)
-        controls_dict = self.check_trigger_zeroed(new_data)
+        controls = self.check_trigger_zeroed(new_data)
+        if controls is None:
+            return
 
         self.dbg("controller_event",
                  "Storing data with key: {}", [self.get_name()])
         self.dbg("controller_verbose",
-                 "\n\tController data:\n\t {}", [controls_dict])
-        self.store_data(controls_dict)
+                 "\n\tController data:\n\t {}", [controls])
+        self.store_data(controls, trace.hop(self.profiler, "sample"))
 
     def print_data(self, d: dict):
         for val in d:
             print(str(val) + ":\t" + str(d[val]))
 
-    def check_trigger_zeroed(self, data: dict):
+    def check_trigger_zeroed(self, data: Record) -> Union[Record, None]:
+        """Returns None until the triggers have been zeroed
+        """
         if self.triggers_zeroed:
             return data
         left = data.get("trigger_left")
@@ -126,16 +140,18 @@ class Controller(AsyncEndpoint):
         self.dbg("controller_error",
                  "Please zero triggers: left: {}, right: {}",
                  [left, right])
-        return {}
+        return None
 
-    def map_input_dict(self, joystick_data: dict) -> dict:
-        """Convert pygame input names to our names based off settings
+    def map_input_dict(self, joystick_data: dict) -> Record:
+        """Convert pygame input to a controls record based off settings
+        Values that are not fields of the controls schema are dropped
         """
-        control_data = {}
+        control_data = CONTROLS_SCHEMA.new()
+        fields = CONTROLS_SCHEMA.index
         for k in joystick_data.keys():
             (new_key, new_value) = self.map_input(k, joystick_data[k])
-            if new_key is not None:
-                control_data[new_key] = new_value
+            if new_key in fields:
+                setattr(control_data, new_key, new_value)
         return control_data
 
     def map_input(self, key: str, value) -> Tuple:
@@ -1,11 +1,15 @@
-from collections import deque
-from typing import List, Union
+from functools import partial
+from threading import Condition
+from time import monotonic
+from typing import Callable, List, Union
 
 import settings
 from snr.datastore import Datastore
-from snr.task import SomeTasks, Task, TaskPriority
-from snr.utils.utils import sleep
+from snr.executor import TaskExecutor
+from snr.task import SomeTasks, Task, TaskProducer, task_type_id
+from snr.task_queue import TaskQueue
 from snr.profiler import Profiler, Timer
+from snr.recorder import Recorder
 from snr.utils.debug import Debugger
 
 
@@ -13,14 +17,52 @@ class Node:
     def __init__(self, debugger: Debugger,
                  role: str, mode: str,
                  factories: list):
+        self.debugger = debugger
         self.dbg = debugger.debug
+        # Handles for channels debugged for every task
+        self.schedule_verbose = debugger.channel("schedule_verbose")
         self.role = role
         self.mode = mode
-        self.task_queue = deque()
-        self.datastore = Datastore(self.dbg)
+        self.task_queue = TaskQueue(self.dbg, settings.TASK_AGING_S,
+                                    settings.TASK_COALESCE_KEYS,
+                                    settings.TASK_QUEUE_MAX_LEN,
+                                    settings.TASK_QUEUE_BACKPRESSURE_LEN,
+                                    settings.TASK_DROP_POLICY)
+        # Wakes the main loop when tasks are scheduled or data is published
+        self.task_available = Condition()
+        self.next_producer_time = 0.0  # When task producers are next due
+        self.data_published = False  # Trigger data stored since last poll
+        self.published_keys = set()  # Trigger keys stored since last poll
+        self.trigger_keys = set()  # Keys that task producers trigger on
+        recorder = None
+        if settings.RECORD_DATASTORE:
+            recorder = Recorder(self.dbg, settings.RECORDER_DIRECTORY,
+                                f"{role}_datastore",
+                                settings.RECORDER_SEGMENT_BYTES,
+                                settings.RECORDER_MAX_SEGMENTS,
+                                settings.RECORDER_FLUSH_S,
+                                settings.RECORDER_INDEX_INTERVAL)
+        self.datastore = Datastore(self.dbg,
+                                   settings.DATASTORE_HISTORY_LEN,
+                                   settings.DATASTORE_NUMERIC_KEYS,
+                                   settings.DATASTORE_TTL_S,
+                                   recorder)
+        # Mapped by ProcEndpoint processes, which cannot share the datastore.
+        # Created for the first ProcEndpoint, see get_shared_datastore()
+        self.shared_datastore = None
+        self.shared_datastore_unavailable = False
 
         self.endpoints = []
         self.task_producers = []
+        # Index of task type id -> tuple of (profiling name, handler, endpoint)
+        self.task_handlers = {}
+        # Same index for handlers given every queued task of a type at once
+        self.batch_task_handlers = {}
+        self.executor = TaskExecutor(self.dbg, settings.TASK_EXECUTORS,
+                                     settings.TASK_POOL_WORKERS,
+                                     settings.TASK_LANE_MAX_PENDING,
+                                     settings.TASK_DROP_POLICY)
+        self.unhandled_task_counts = {}
 
         self.profiler = None
         if settings.ENABLE_PROFILING:
@@ -40,13 +82,66 @@ class Node:
         for f in factories:
             endpoint = f.get(self)
             if endpoint is not None:
-                self.endpoints.append(endpoint)
-                if endpoint.task_producers:
-                    for fn in endpoint.task_producers:
-                        self.task_producers.append(fn)
+                self.add_endpoint(endpoint)
 
             self.dbg("framework_verbose", "{} added {}", [f, endpoint])
 
+    def add_endpoint(self, endpoint):
+        """Register an endpoint's task producers and handlers
+        Can be called at runtime after the Node is initialized
+        """
+        self.endpoints.append(endpoint)
+        if endpoint.task_producers:
+            for producer in endpoint.task_producers:
+                if not isinstance(producer, TaskProducer):
+                    producer = TaskProducer(producer,
+                                            settings.TASK_PRODUCER_PERIOD_S)
+                self.task_producers.append(producer)
+                key = producer.trigger_key
+                if key is not None and key not in self.trigger_keys:
+                    self.trigger_keys.add(key)
+                    self.datastore.subscribe(key, self.notify_data_published)
+        for task_type, handler in endpoint.task_handlers.items():
+            type_id = task_type_id(task_type)
+            entry = (f"{task_type}:{endpoint.name}", handler, endpoint)
+            # Replace rather than mutate so a running dispatch is unaffected
+            self.task_handlers[type_id] = (
+                self.task_handlers.get(type_id, ()) + (entry,))
+        batch_handlers = getattr(endpoint, "batch_task_handlers", {})
+        for task_type, handler in batch_handlers.items():
+            type_id = task_type_id(task_type)
+            entry = (f"{task_type}[batch]:{endpoint.name}", handler, endpoint)
+            self.batch_task_handlers[type_id] = (
+                self.batch_task_handlers.get(type_id, ()) + (entry,))
+
+    def remove_endpoint(self, endpoint):
+        """Stop scheduling work for an endpoint at runtime
+        The endpoint is not terminated.
+        """
+        if endpoint not in self.endpoints:
+            self.dbg("framework_warning",
+                     "Cannot remove {}, not an endpoint of this node",
+                     [endpoint])
+            return
+        self.endpoints.remove(endpoint)
+        self.task_producers = [p for p in self.task_producers
+                               if p not in endpoint.task_producers and
+                               p.handler not in endpoint.task_producers]
+        batch_handlers = getattr(endpoint, "batch_task_handlers", {})
+        for index, endpoint_handlers in [
+                (self.task_handlers, endpoint.task_handlers),
+                (self.batch_task_handlers, batch_handlers)]:
+            for task_type, handler in endpoint_handlers.items():
+                type_id = task_type_id(task_type)
+                remaining = tuple(entry for entry
+                                  in index.get(type_id, ())
+                                  if entry[1] != handler)
+                if remaining:
+                    index[type_id] = remaining
+                else:
+                    index.pop(type_id, None)
+        self.dbg("framework", "Removed endpoint {}", [endpoint])
+
     def assign_node_ip(self):
         ip = "localhost"
         if not self.mode == "debug":
@@ -76,65 +171,199 @@ class Node:
         return "localhost"
 
     def loop(self):
+        """Run tasks until terminated
+
+        Tasks are drained back to back. When the queue is empty the loop
+        blocks in get_next_task() instead of sleeping for a fixed period.
+        """
         while not self.terminate_flag:
             self.step_task()
-            self.dbg("schedule_verbose", "Task queue: \n{}",
-                     [self.repr_task_queue()])
-            sleep(0.030)
+            if self.schedule_verbose.enabled:
+                self.schedule_verbose("Task queue: \n{}",
+                                      [self.repr_task_queue()])
         self.terminate()
 
+    def notify(self):
+        """Wake the main loop if it is waiting for tasks
+        """
+        with self.task_available:
+            self.task_available.notify_all()
+
+    def start_async_endpoint(self, endpoint) -> bool:
+        """Offer to run an AsyncEndpoint's loop as part of the node
+
+        Returns False when the endpoint must start its own thread, which is
+        always the case for the threaded Node.
+        """
+        return False
+
+    def notify_data_published(self, key: str):
+        """Called by the datastore when data for a trigger key is stored
+        Wakes the main loop to call the task producers triggered by the key.
+        """
+        with self.task_available:
+            self.published_keys.add(key)
+            self.data_published = True
+        self.notify()
+
+    def producers_due(self) -> bool:
+        return self.data_published or monotonic() >= self.next_producer_time
+
+    def wait_timeout(self) -> Union[float, None]:
+        """Seconds until a producer is due or a datastore key expires
+        None if neither will happen without being notified
+        """
+        now = monotonic()
+        timeout = min(self.next_producer_time - now,
+                      self.datastore.next_expiry_time - now)
+        if timeout == float("inf"):
+            return None
+        return max(timeout, 0.0)
+
+    def is_backpressured(self) -> bool:
+        """Whether the task queue is too deep to take on more work
+
+        Producers are not called while the node is backpressured. Endpoints
+        which emit work from their own threads should check this first.
+        """
+        return self.task_queue.backpressured()
+
     def get_new_tasks(self):
-        """Retrieve tasks from endpoints and queue them.
-        """
-        # new_tasks = [e.get_new_tasks() for e in self.endpoints]
-        for task_producer in self.task_producers:
-            t = task_producer()
-            if t and (isinstance(t, Task) or
-                      (isinstance(t, List) and
-                       len(t) > 0)):
-                self.dbg("schedule_new_tasks",
-                         "Produced task: {} from {}",
-                         [t, task_producer.__module__])
-                self.schedule_task(t)
+        """Call the task producers that are due and queue their tasks.
+        """
+        with self.task_available:
+            published_keys = self.published_keys
+            self.published_keys = set()
+            self.data_published = False
+
+        now = monotonic()
+        next_producer_time = float("inf")
+        backpressured = self.is_backpressured()
+        if backpressured:
+            self.dbg("schedule_warning",
+                     "Task queue backpressured, deferring producers")
+        for producer in self.task_producers:
+            if not producer.due(now, published_keys):
+                pass
+            elif backpressured:
+                # Retry after one more period rather than spinning
+                if producer.period_s is not None:
+                    producer.next_time = now + producer.period_s
+            else:
+                t = producer.produce(now)
+                if t and (isinstance(t, Task) or
+                          (isinstance(t, List) and
+                           len(t) > 0)):
+                    self.dbg("schedule_new_tasks",
+                             "Produced task: {} from {}",
+                             [t, producer])
+                    self.schedule_task(t)
+            if producer.period_s is not None:
+                next_producer_time = min(next_producer_time,
+                                         producer.next_time)
+        self.next_producer_time = next_producer_time
 
     def execute_task(self, t: Task):
         """Execute the given task
 
         Note that the task is pass in and can be provided on the fly rather
         than needing to be in the queue.
+
+        If an endpoint registered a batch handler for the task's type, every
+        queued task of that type is taken off the queue and the batch
+        handler is called once with the list. Regular handlers of the type
+        are still called once per task.
         """
         if not t:
             self.dbg("execute_task", "Tried to execute None")
             return
 
-        task_result = []
+        handlers = self.task_handlers.get(t.type_id, ())
+        batch_handlers = self.batch_task_handlers.get(t.type_id, ())
+        if not (handlers or batch_handlers):
+            self.count_unhandled_task(t)
+            return
 
-        for e in self.endpoints:
-            handler = e.task_handlers.get(t.task_type)
-            result = None
-            if handler is not None:
-                if self.profiler is None:
-                    result = handler(t)
-                else:
-                    result = self.profiler.time(f"{t.task_type}:{e.name}",
-                                                lambda: handler(t))
-            if result:
-                task_result.append(result)
-
-        self.dbg("schedule_verbose",
-                 "Task execution resulted in {} new tasks",
-                 [len(list(task_result))])
+        tasks = [t]
+        if batch_handlers:
+            with self.task_available:
+                tasks += self.task_queue.pop_type(t.type_id)
+
+        if self.profiler is not None:
+            now = monotonic()
+            for task in tasks:
+                if task.scheduled_time is not None:
+                    self.profiler.log_task(f"latency:{task.task_type}",
+                                           now - task.scheduled_time)
+
+        task_result = []
+        for name, handler, endpoint in batch_handlers:
+            self.run_or_dispatch(name, handler, endpoint, t, tasks,
+                                 task_result)
+        for name, handler, endpoint in handlers:
+            for task in tasks:
+                self.run_or_dispatch(name, handler, endpoint, t, task,
+                                     task_result)
+
+        self.schedule_verbose("Task execution resulted in {} new tasks",
+                              [len(task_result)])
         if task_result:
             # Only procede if not empty
             self.schedule_task(task_result)
 
+    def run_or_dispatch(self, name: str, handler: Callable, endpoint,
+                        head: Task, t: Union[Task, List[Task]],
+                        task_result: list):
+        """Run a handler inline or hand it to its executor
+
+        head is the task popped from the queue, t is the handler's argument.
+        """
+        if not self.executor.runs_inline(head.type_id, endpoint):
+            self.executor.dispatch(head.type_id, endpoint, head.priority,
+                                   partial(self.run_handler_async,
+                                           name, handler, t))
+            return
+        result = self.run_handler(name, handler, t)
+        if result:
+            task_result.append(result)
+
+    def run_handler(self, name: str, handler: Callable,
+                    t: Union[Task, List[Task]]) -> SomeTasks:
+        if self.profiler is None:
+            return handler(t)
+        return self.profiler.time(name, handler, t)
+
+    def run_handler_async(self, name: str, handler: Callable,
+                          t: Union[Task, List[Task]]):
+        """Run a handler on an executor thread and schedule its result
+        """
+        try:
+            result = self.run_handler(name, handler, t)
+        except Exception as error:
+            self.dbg("execute_task",
+                     "Handler {} raised: {}", [name, error.__repr__()])
+            return
+        if result:
+            self.schedule_task(result)
+
+    def count_unhandled_task(self, t: Task):
+        count = self.unhandled_task_counts.get(t.task_type, 0) + 1
+        self.unhandled_task_counts[t.task_type] = count
+        if count == 1:
+            self.dbg("schedule_warning",
+                     "No endpoint handles task type {}",
+                     [t.task_type])
+
     def set_terminate_flag(self):
         # self.datastore.store("node_exit_reason", reason)
         self.terminate_flag = True
+        self.notify()
 
     def terminate(self):
         """Execute actions needed to deconstruct a Node
         """
+        self.executor.terminate()
+
         for e in self.endpoints:
             e.set_terminate_flag()
 
@@ -142,6 +371,13 @@ class Node:
             e.join()
 
         self.datastore.terminate()
+        if self.shared_datastore is not None:
+            self.shared_datastore.terminate()
+        self.task_queue.dump()
+        for task_type, count in self.unhandled_task_counts.items():
+            self.dbg("schedule_warning",
+                     "Dropped {} unhandled {} tasks",
+                     [count, task_type])
 
         if self.profiler is not None:
             self.profiler.terminate()
@@ -150,7 +386,8 @@ class Node:
     def step_task(self):
         # Get the next task to execute
         t = self.get_next_task()
-        self.execute_task(t)
+        if t is not None:
+            self.execute_task(t)
 
     def has_tasks(self) -> bool:
         """Report whether there are enough tasks left in the queue
@@ -169,13 +406,11 @@ class Node:
 
         if isinstance(t, list):
             # Recursively handle lists
-            self.dbg("schedule_verbose",
-                     "Recursively scheduling list of {} tasks",
-                     [len(t)])
+            self.schedule_verbose("Recursively scheduling list of {} tasks",
+                                  [len(t)])
             for item in t:
-                self.dbg("schedule_verbose",
-                         "Recursively scheduling item {}",
-                         [item])
+                self.schedule_verbose("Recursively scheduling item {}",
+                                      [item])
                 self.schedule_task(item)
             return
 
@@ -186,29 +421,65 @@ class Node:
             return
 
         # Handle normal tasks
-        self.dbg("schedule_verbose", "Scheduling task {}", [t])
-        if t.priority == TaskPriority.high:
-            self.task_queue.append(t)  # High priotity at front (right)
-        elif t.priority == TaskPriority.normal:
-            self.task_queue.appendleft(t)  # Normal priotity at end (left)
-            # TODO:  insert normal priority in between high and low
-        elif t.priority == TaskPriority.low:
-            self.task_queue.appendleft(t)  # Normal priotity at end (left)
-        else:
-            self.dbg("schedule", "Cannot schedule task with priority: {}",
-                     [t.priority])
+        self.schedule_verbose("Scheduling task {}", [t])
+        with self.task_available:
+            if not self.task_queue.push(t):
+                return
+        self.notify()
+
+    def pop_task(self) -> Union[Task, None]:
+        """Take the next task off the queue if there is one
+        """
+        with self.task_available:
+            if not self.has_tasks():
+                return None
+            self.schedule_verbose("Popping task, {} remaining",
+                                  [len(self.task_queue) - 1])
+            return self.task_queue.pop()
 
     def get_next_task(self) -> Union[Task, None]:
         """Take the next task off the queue
+
+        Task producers that are due are called first. When there are no
+        tasks, blocks until a task is scheduled, a producer is due or
+        trigger data is published. Returns None if the node is terminated
+        while waiting.
+        """
+        while not self.terminate_flag:
+            if self.producers_due():
+                self.dbg("schedule_event", "Task producers due")
+                self.get_new_tasks()
+            # Expiry subscribers may schedule tasks
+            self.datastore.expire()
+            with self.task_available:
+                t = self.pop_task()
+                if t is not None:
+                    return t
+                if not self.producers_due():
+                    self.task_available.wait(self.wait_timeout())
+        return None
+
+    def get_shared_datastore(self):
+        """Datastore shared with ProcEndpoint processes, created on first use
+
+        None if it is turned off or unavailable, as multiprocessing
+        shared_memory requires Python 3.8.
         """
-        while not self.has_tasks():
-            self.dbg("schedule_event", "Ran out of tasks, getting more")
-            self.get_new_tasks()
-        self.dbg(
-            "schedule_verbose", "Popping task, {} remaining", [
-                len(self.task_queue) - 1]
-        )
-        return self.task_queue.pop()
+        if (self.shared_datastore is None and
+                not self.shared_datastore_unavailable and
+                settings.SHARED_DATASTORE_SLOTS > 0):
+            try:
+                from snr.shared_datastore import SharedDatastore
+            except ImportError as error:
+                self.shared_datastore_unavailable = True
+                self.dbg("datastore_error",
+                         "Shared datastore unavailable: {}",
+                         [error.__repr__()])
+                return None
+            self.shared_datastore = SharedDatastore(
+                self.dbg, settings.SHARED_DATASTORE_SLOTS,
+                settings.SHARED_DATASTORE_BLOB_SIZE)
+        return self.shared_datastore
 
     def store_data(self, key: str, data):
         self.datastore.store(key, data)
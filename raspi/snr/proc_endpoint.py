@@ -34,8 +34,16 @@ class ProcEndpoint(Endpoint):
         self.set_delay(tick_rate_hz)
         if parent:
             self.profiler = parent.profiler
+            # Stores in the Node's datastore would stay in this process
+            self.datastore = parent.get_shared_datastore()
+            if self.datastore is None:
+                self.dbg("framework_warning",
+                         "No shared datastore, data stored by {} stays in "
+                         "its process", [name])
+                self.datastore = parent.datastore
         else:
             self.profiler = None
+            self.datastore = None
 
     def set_delay(self, tick_rate_hz: float):
         if tick_rate_hz == 0:
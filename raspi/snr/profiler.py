@@ -18,10 +18,12 @@ class Profiler:
         self.dbg = dbg
         self.time_dict = {}
         self.moving_avg_len = settings.PROFILING_AVG_WINDOW_LEN
+        # Latencies keep a longer window so tail percentiles are meaningful
+        self.latency_window_len = settings.PROFILING_LATENCY_WINDOW_LEN
 
-    def time(self, name: str, handler: Callable):
+    def time(self, name: str, handler: Callable, *args):
         time = Timer()
-        result = handler()
+        result = handler(*args)
         self.log_task(name, time.end())
         return result
 
@@ -37,6 +39,11 @@ class Profiler:
         self.dbg("profiling_avg", "Task {} has average runtime {}",
                  [task_type, self.avg_time(task_type)])
 
+    def log_latency(self, name: str, latency: float):
+        if self.time_dict.get(name) is None:
+            self.time_dict[name] = deque(maxlen=self.latency_window_len)
+        self.log_task(name, latency)
+
     def init_task_type(self, task_type: str):
         self.time_dict[task_type] = deque(maxlen=self.moving_avg_len)
 
@@ -44,10 +51,20 @@ class Profiler:
         return self.format_time(sum(self.time_dict[task_type]) /
                                 len(self.time_dict[task_type]))
 
+    def percentile(self, task_type: str, p: float) -> str:
+        """Nearest rank percentile of the recorded window, p in [0, 100]
+        """
+        times = sorted(self.time_dict[task_type])
+        rank = int(round(p / 100 * (len(times) - 1)))
+        return self.format_time(times[rank])
+
     def dump(self):
-        self.dbg("profiling_dump", "Task/Loop type:\t\tAvg runtime: ")
+        self.dbg("profiling_dump",
+                 "Task/Loop type:\t\tAvg runtime:\tp50:\tp99:")
         for k in self.time_dict:
-            self.dbg("profiling_dump", "{}:\t\t{}", [k, self.avg_time(k)])
+            self.dbg("profiling_dump", "{}:\t\t{}\t{}\t{}",
+                     [k, self.avg_time(k),
+                      self.percentile(k, 50), self.percentile(k, 99)])
 
     def format_time(self, time_s: float) -> str:
         if time_s > 1:
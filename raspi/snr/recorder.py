@@ -0,0 +1,282 @@
+"""Append-only binary log of every Datastore write
+
+The Datastore hands each stored value to Recorder.record(), which only
+appends to a deque. A background thread drains the deque on a timer and
+encodes records into a memory mapped log segment, so recording adds no
+system calls to the Node's main loop or endpoint threads.
+
+Segment layout:
+    header: magic, wall clock time() and monotonic() when it was opened
+    records: type, key id, monotonic timestamp, length, payload
+    footer: marshalled seek index and key names, then a trailer
+
+A KEY record names a key id the first time the key is written in a segment,
+so every segment can be read on its own. VALUE records hold the value
+encoded with marshal, with schema records logged as their dict. A segment
+that was not closed, for example after a crash, has no footer. Its records
+end at the first zeroed record header, since segments are preallocated.
+
+Segments rotate once they reach segment_size bytes. Only the newest
+max_segments segments of a run are kept.
+"""
+
+import marshal
+import mmap
+import os
+import struct
+from bisect import bisect_right
+from collections import deque
+from glob import glob
+from threading import Thread
+from time import monotonic, sleep, strftime, time
+from typing import Callable, Iterator, List, Tuple
+
+from snr.schema import Record as SchemaRecord
+
+SEGMENT_MAGIC = b"SNRLOG01"
+FOOTER_MAGIC = b"SNRIDX01"
+SEGMENT_EXTENSION = ".snrlog"
+
+# Record types, 0 marks the end of records in an unclosed segment
+KEY = 1
+VALUE = 2
+
+HEADER = struct.Struct("=8sdd")
+RECORD = struct.Struct("=BHdI")
+TRAILER = struct.Struct("=QI8s")  # Footer offset, footer length, magic
+
+Record = Tuple[str, float, object]  # key, monotonic timestamp, value
+
+
+class Recorder:
+    def __init__(self, dbg: Callable, directory: str, name: str,
+                 segment_size: int, max_segments: int,
+                 flush_s: float, index_interval: int):
+        self.dbg = dbg
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.flush_s = flush_s
+        # Records between seek index entries
+        self.index_interval = index_interval
+        os.makedirs(directory, exist_ok=True)
+        self.path_prefix = os.path.join(
+            directory, "{}_{}".format(name, strftime("%Y%m%d-%H%M%S")))
+
+        self.pending = deque()  # (key, timestamp, value) awaiting encoding
+        self.key_ids = {}  # Key -> id, stable across segments
+        self.segments = []  # Paths of segments kept, oldest first
+        self.segment_count = 0
+        self.segment = None
+        self.unencodable_keys = set()
+        self.record_count = 0
+        self.max_pending = 0
+
+        self.terminate_flag = False
+        self.thread = Thread(target=self.threaded_method, daemon=True)
+        self.thread.start()
+
+    def record(self, key: str, timestamp: float, value):
+        """Queue a value to be written, safe to call from any thread
+        """
+        self.pending.append((key, timestamp, value))
+
+    def threaded_method(self):
+        while not self.terminate_flag:
+            sleep(self.flush_s)
+            self.drain()
+        self.drain()
+        self.close_segment()
+
+    def drain(self):
+        self.max_pending = max(self.max_pending, len(self.pending))
+        while self.pending:
+            key, timestamp, value = self.pending.popleft()
+            if isinstance(value, SchemaRecord):
+                value = value.to_dict()
+            try:
+                payload = marshal.dumps(value)
+            except ValueError:
+                if key not in self.unencodable_keys:
+                    self.unencodable_keys.add(key)
+                    self.dbg("recorder_error",
+                             "Cannot record {} values of type {}",
+                             [key, value.__class__])
+                continue
+            self.write_value(key, timestamp, payload)
+
+    def write_value(self, key: str, timestamp: float, payload: bytes):
+        size = RECORD.size + len(payload)
+        if self.segment is not None and not self.segment.fits(
+                size + RECORD.size + len(key.encode())):
+            self.close_segment()
+        if self.segment is None:
+            self.open_segment()
+            if not self.segment.fits(size + RECORD.size + len(key.encode())):
+                self.dbg("recorder_error",
+                         "Record of {} bytes for {} is larger than a segment",
+                         [size, key])
+                return
+
+        key_id = self.key_ids.get(key)
+        if key_id is None:
+            key_id = len(self.key_ids)
+            self.key_ids[key] = key_id
+        if key_id not in self.segment.keys:
+            self.segment.write(KEY, key_id, timestamp, key.encode())
+            self.segment.keys[key_id] = key
+        if self.segment.count % self.index_interval == 0:
+            self.segment.index.append((timestamp, self.segment.offset))
+        self.segment.write(VALUE, key_id, timestamp, payload)
+        self.record_count += 1
+
+    def open_segment(self):
+        path = "{}_{:04d}{}".format(self.path_prefix, self.segment_count,
+                                    SEGMENT_EXTENSION)
+        self.segment = Segment(path, self.segment_size)
+        self.segments.append(path)
+        self.segment_count += 1
+        self.dbg("recorder_event", "Recording to {}", [path])
+        while len(self.segments) > self.max_segments:
+            old_path = self.segments.pop(0)
+            try:
+                os.remove(old_path)
+            except OSError as error:
+                self.dbg("recorder_error", "Could not remove {}: {}",
+                         [old_path, error.__repr__()])
+
+    def close_segment(self):
+        if self.segment is not None:
+            self.segment.close()
+            self.segment = None
+
+    def terminate(self):
+        self.terminate_flag = True
+        self.thread.join()
+        self.dbg("recorder_event",
+                 "Recorded {} values in {} segments, at most {} pending",
+                 [self.record_count, self.segment_count, self.max_pending])
+
+
+class Segment:
+    """One preallocated, memory mapped log file being written
+    """
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.file = open(path, "w+b")
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+        HEADER.pack_into(self.map, 0, SEGMENT_MAGIC, time(), monotonic())
+        self.offset = HEADER.size
+        self.count = 0  # VALUE records written
+        self.index = []  # (timestamp, offset) of every index_interval'th
+        self.keys = {}  # Key id -> key, written to this segment
+
+    def fits(self, size: int) -> bool:
+        return self.offset + size <= len(self.map)
+
+    def write(self, record_type: int, key_id: int,
+              timestamp: float, payload: bytes):
+        RECORD.pack_into(self.map, self.offset,
+                         record_type, key_id, timestamp, len(payload))
+        start = self.offset + RECORD.size
+        self.map[start:start + len(payload)] = payload
+        self.offset = start + len(payload)
+        if record_type == VALUE:
+            self.count += 1
+
+    def close(self):
+        """Trim unused space and append the footer
+        """
+        self.map.flush()
+        self.map.close()
+        footer = marshal.dumps({"index": self.index, "keys": self.keys})
+        self.file.truncate(self.offset)
+        self.file.seek(self.offset)
+        self.file.write(footer)
+        self.file.write(TRAILER.pack(self.offset, len(footer),
+                                     FOOTER_MAGIC))
+        self.file.close()
+
+
+class LogReader:
+    """Lazily iterates the records of one log segment
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.wall_time, self.monotonic_time = HEADER.unpack_from(
+            self.map, 0)
+        if magic != SEGMENT_MAGIC:
+            raise ValueError(f"{path} is not a datastore log")
+        self.end = len(self.map)
+        self.index = []
+        self.keys = {}
+        if self.end >= HEADER.size + TRAILER.size:
+            footer_offset, footer_len, magic = TRAILER.unpack_from(
+                self.map, self.end - TRAILER.size)
+            if magic == FOOTER_MAGIC:
+                footer = marshal.loads(
+                    self.map[footer_offset:footer_offset + footer_len])
+                self.index = footer["index"]
+                self.keys = footer["keys"]
+                self.end = footer_offset
+
+    def __iter__(self) -> Iterator[Record]:
+        return self.records(HEADER.size)
+
+    def seek(self, timestamp: float) -> Iterator[Record]:
+        """Iterate from the first record at or after timestamp
+
+        Uses the footer index to skip ahead, or reads from the start of a
+        segment that was not closed.
+        """
+        offset = HEADER.size
+        i = bisect_right([t for t, _ in self.index], timestamp) - 1
+        if i >= 0:
+            offset = self.index[i][1]
+        for record in self.records(offset):
+            if record[1] >= timestamp:
+                yield record
+
+    def records(self, offset: int) -> Iterator[Record]:
+        keys = dict(self.keys)
+        while offset + RECORD.size <= self.end:
+            record_type, key_id, timestamp, length = RECORD.unpack_from(
+                self.map, offset)
+            if record_type == 0:
+                break  # Zeroed space of an unclosed segment
+            start = offset + RECORD.size
+            offset = start + length
+            payload = self.map[start:offset]
+            if record_type == KEY:
+                keys[key_id] = payload.decode()
+            elif record_type == VALUE:
+                yield keys[key_id], timestamp, marshal.loads(payload)
+
+    def wall_time_of(self, timestamp: float) -> float:
+        """Convert a record's monotonic timestamp to time()
+        """
+        return self.wall_time + (timestamp - self.monotonic_time)
+
+    def close(self):
+        self.map.close()
+
+
+def log_segments(path_prefix: str) -> List[str]:
+    """Segments of a recorded run in order, given the run's path prefix
+    """
+    return sorted(glob(path_prefix + "*" + SEGMENT_EXTENSION))
+
+
+def read_log(paths: List[str]) -> Iterator[Record]:
+    """Lazily iterate the records of several segments in order
+    """
+    for path in paths:
+        reader = LogReader(path)
+        try:
+            yield from reader
+        finally:
+            reader.close()
@@ -0,0 +1,141 @@
+"""Replay a recorded datastore log into a Node
+
+A Replayer stores the values of the chosen keys from a log written by
+snr.recorder back into its Node's datastore, in their recorded order.
+Consumers subscribed to those keys then run as they did during the recorded
+run, so endpoints like ControlsProcessor and the scheduler can be profiled
+against real dive traffic, or field bugs reproduced offline.
+
+Timing is set by speed:
+    1: original timing
+    > 1: accelerated, e.g. 10 replays ten times faster
+    0: as fast as possible, pausing while the Node is backpressured
+"""
+
+from time import monotonic, sleep
+from typing import List
+
+import settings
+from snr.async_endpoint import AsyncEndpoint
+from snr.endpoint import Endpoint
+from snr.factory import Factory
+from snr.node import Node
+from snr.recorder import log_segments, read_log
+from snr.schema import schema_for
+from snr.task import SomeTasks, Task
+
+# Longest single sleep while waiting, so termination is not delayed
+MAX_WAIT_S = 0.1
+BACKPRESSURE_WAIT_S = 0.001
+
+
+class ReplayFactory(Factory):
+    def __init__(self, path_prefix: str, keys: List[str], speed: float):
+        super().__init__()
+        self.path_prefix = path_prefix
+        self.keys = keys
+        self.speed = speed
+
+    def get(self, parent: Node) -> Endpoint:
+        return Replayer(parent, "replay", self.path_prefix,
+                        self.keys, self.speed)
+
+    def __repr__(self):
+        return f"Replay Factory: {self.path_prefix} x{self.speed}"
+
+
+class Replayer(AsyncEndpoint):
+    def __init__(self, parent: Node, name: str,
+                 path_prefix: str, keys: List[str], speed: float):
+        self.task_producers = []
+        # Requests for replayed data are answered by the replay itself
+        self.task_handlers = {f"get_{key}": self.task_handler
+                              for key in keys}
+
+        super().__init__(parent, name,
+                         self.init_replay, self.replay_next, 0)
+        self.path_prefix = path_prefix
+        self.keys = set(keys)
+        self.speed = speed
+        self.log = None  # Generator reading the segments, owns the reader
+        self.records = iter(())
+        self.replayed_count = 0
+        self.start_time = None
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.start_loop()
+
+    def task_handler(self, t: Task) -> SomeTasks:
+        return None
+
+    def init_replay(self):
+        paths = log_segments(self.path_prefix)
+        if not paths:
+            self.dbg("replay_error", "No recorded log segments for {}",
+                     [self.path_prefix])
+            self.finish()
+            return
+        self.dbg("replay", "Replaying {} from {} segments at speed {}",
+                 [sorted(self.keys), len(paths), self.speed])
+        self.log = read_log(paths)
+        self.records = (record for record in self.log
+                        if record[0] in self.keys)
+        # Record timestamps are monotonic() times
+        self.start_time = monotonic()
+
+    def replay_next(self):
+        record = next(self.records, None)
+        if record is None:
+            self.finish()
+            return
+        key, timestamp, value = record
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
+        self.last_timestamp = timestamp
+
+        if self.speed > 0:
+            self.wait_until(self.start_time +
+                            (timestamp - self.first_timestamp) / self.speed)
+        else:
+            while (self.parent.is_backpressured() and
+                   not self.terminate_flag):
+                sleep(BACKPRESSURE_WAIT_S)
+        if self.terminate_flag:
+            return
+        schema = schema_for(key)
+        if schema is not None and isinstance(value, dict):
+            # Schema records are logged as dicts
+            value = schema.from_dict(value)
+        self.parent.datastore.store(key, value)
+        self.replayed_count += 1
+
+    def tick(self):
+        # replay_next waits for each record's time itself
+        return
+
+    def wait_until(self, replay_time: float):
+        remaining = replay_time - monotonic()
+        while remaining > 0 and not self.terminate_flag:
+            sleep(min(remaining, MAX_WAIT_S))
+            remaining = replay_time - monotonic()
+
+    def finish(self):
+        if self.first_timestamp is not None:
+            self.dbg("replay",
+                     "Replayed {} values recorded over {:6.3f} s in {:6.3f} s",
+                     [self.replayed_count,
+                      self.last_timestamp - self.first_timestamp,
+                      monotonic() - self.start_time])
+        self.set_terminate_flag()
+        if settings.REPLAY_EXIT_AT_END:
+            # Let the node finish the work the replayed data caused
+            while self.parent.has_tasks() and not self.parent.terminate_flag:
+                sleep(BACKPRESSURE_WAIT_S)
+            self.parent.set_terminate_flag()
+
+    def terminate(self):
+        if self.log is not None:
+            # Closes the open segment's reader
+            self.log.close()
+            self.log = None
+        self.records = iter(())
@@ -0,0 +1,200 @@
+"""Fixed field records for data exchanged between Nodes
+
+A Schema is compiled from a list of (name, type) fields. It generates a
+Record class with one slot per field, and a struct that packs every field
+into a fixed size binary form:
+    int: int16
+    bool: 1 byte
+    float: float32
+    tuple: pair of int8, such as a dpad hat
+
+Records replace dicts of the same values, so they provide get() and
+to_dict() for code that still expects a dict. changed_mask() compares two
+records field by field, so consumers can act on only the fields that changed.
+
+Schemas are registered by name and by an id derived from their fields, so a
+receiver can unpack a record it did not create and detect a mismatched
+schema.
+"""
+
+import struct
+import zlib
+from operator import attrgetter
+from typing import Iterator, List, Tuple, Union
+
+import settings
+
+FORMATS = {
+    int: "h",
+    bool: "?",
+    float: "f",
+    tuple: "bb",
+}
+DEFAULTS = {
+    int: 0,
+    bool: False,
+    float: 0.0,
+    tuple: (0, 0),
+}
+
+schemas_by_id = {}  # Schema id -> Schema
+schemas_by_name = {}  # Data name -> Schema
+
+
+class Record:
+    """Base class of the record classes generated by a Schema
+    """
+    __slots__ = ()
+    schema = None
+
+    def get(self, key: str, default=None):
+        """Read a field like a dict of the same values would
+        """
+        return getattr(self, key, default)
+
+    def to_dict(self) -> dict:
+        return dict(zip(self.schema.names, self.schema.getter(self)))
+
+    def values(self) -> tuple:
+        return self.schema.getter(self)
+
+    def copy(self) -> "Record":
+        return self.schema.from_values(self.schema.getter(self))
+
+    def changed_mask(self, previous: Union["Record", None]) -> int:
+        """Bit i is set if field i differs from previous
+
+        Every field is changed when there is no previous record.
+        """
+        if previous is None:
+            return self.schema.all_mask
+        values = self.schema.getter(self)
+        previous_values = self.schema.getter(previous)
+        if values == previous_values:
+            return 0
+        mask = 0
+        bit = 1
+        for new, old in zip(values, previous_values):
+            if new != old:
+                mask |= bit
+            bit <<= 1
+        return mask
+
+    def changed_fields(self, mask: int) -> Iterator[Tuple[int, str, object]]:
+        """(index, name, value) of each field set in mask
+        """
+        names = self.schema.names
+        for i, value in enumerate(self.schema.getter(self)):
+            if mask & (1 << i):
+                yield i, names[i], value
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Record) or other.schema is not self.schema:
+            return False
+        return self.schema.getter(self) == self.schema.getter(other)
+
+    def __repr__(self):
+        return "{}{}".format(self.schema.name, self.to_dict())
+
+
+class Schema:
+    def __init__(self, name: str, fields: List[Tuple[str, type]]):
+        self.name = name
+        self.fields = fields
+        self.names = tuple(field_name for field_name, _ in fields)
+        self.types = tuple(field_type for _, field_type in fields)
+        self.index = {field_name: i for i, field_name in enumerate(self.names)}
+        self.defaults = tuple(DEFAULTS[t] for t in self.types)
+        self.all_mask = (1 << len(fields)) - 1
+
+        self.struct = struct.Struct(
+            "=" + "".join(FORMATS[t] for t in self.types))
+        self.size = self.struct.size
+        # Positions of tuple fields, which are flattened when packed
+        self.tuple_fields = [i for i, t in enumerate(self.types)
+                             if t is tuple]
+        if len(self.names) == 1:
+            getter = attrgetter(*self.names)
+            self.getter = lambda record: (getter(record),)
+        else:
+            self.getter = attrgetter(*self.names)
+        self.id = zlib.crc32(repr([(n, t.__name__) for n, t in fields])
+                             .encode())
+
+        self.record_class = type(f"{name}_record", (Record,),
+                                 {"__slots__": self.names, "schema": self})
+        schemas_by_id[self.id] = self
+        schemas_by_name[name] = self
+
+    def new(self) -> Record:
+        """Record with every field at its default
+        """
+        return self.from_values(self.defaults)
+
+    def from_values(self, values) -> Record:
+        record = self.record_class()
+        for field_name, value in zip(self.names, values):
+            setattr(record, field_name, value)
+        return record
+
+    def from_dict(self, d: dict) -> Record:
+        """Record from a dict of the same values, missing fields defaulted
+        """
+        return self.from_values(d.get(field_name, default)
+                                for field_name, default
+                                in zip(self.names, self.defaults))
+
+    def pack(self, record: Record) -> bytes:
+        values = self.getter(record)
+        if not self.tuple_fields:
+            return self.struct.pack(*values)
+        flat = []
+        for value, t in zip(values, self.types):
+            if t is tuple:
+                flat.extend(value)
+            else:
+                flat.append(value)
+        return self.struct.pack(*flat)
+
+    def unpack(self, data: bytes, offset: int = 0) -> Record:
+        flat = self.struct.unpack_from(data, offset)
+        if not self.tuple_fields:
+            return self.from_values(flat)
+        values = []
+        i = 0
+        for t in self.types:
+            if t is tuple:
+                values.append((flat[i], flat[i + 1]))
+                i += 2
+            else:
+                values.append(flat[i])
+                i += 1
+        return self.from_values(values)
+
+    def __repr__(self):
+        return f"Schema {self.name}: {len(self.names)} fields, {self.size} B"
+
+
+def schema_from_mappings(name: str, mappings: dict) -> Schema:
+    """Compile a schema from controller mappings, see control_mappings
+
+    Values with a cast type are fields, in the order they are mapped.
+    Dropped and untyped values are not part of the record.
+    """
+    fields = []
+    for map_list in mappings.values():
+        if len(map_list) > 1 and map_list[0] is not None:
+            fields.append((map_list[0], map_list[1]))
+    return Schema(name, fields)
+
+
+def lookup(schema_id: int) -> Union[Schema, None]:
+    return schemas_by_id.get(schema_id)
+
+
+def schema_for(name: str) -> Union[Schema, None]:
+    return schemas_by_name.get(name)
+
+
+CONTROLS_SCHEMA = schema_from_mappings(settings.CONTROLS_DATA_NAME,
+                                       settings.control_mappings)
@@ -0,0 +1,225 @@
+"""Datastore in shared memory for ProcEndpoint processes
+
+ProcEndpoints run in forked processes, so anything they store in the Node's
+Datastore stays in their own copy. A SharedDatastore is created by the Node
+before endpoints are forked and is mapped by every process, so values stored
+by one process can be read by the others.
+
+Memory is split into a fixed number of equally sized slots. Each slot holds
+one key:
+    seq: u64 sequence lock, odd while the slot is being written
+    fresh: u8
+    kind: u8, EMPTY, INT, FLOAT or BLOB
+    length: u16, bytes of payload in use
+    name: key, utf-8, at most NAME_SIZE bytes
+    payload: blob_size bytes, an int64, a float64 or a marshalled value
+
+Keys are given a slot the first time they are stored. Writers from any
+process are serialized by a lock. Readers do not lock: they retry until the
+sequence number is even and unchanged across the read, so they never see a
+half written value. Slots are looked up by name with the lock held, since
+names are written inside the sequence lock.
+
+The sequence lock relies on other processes seeing the writes to shared
+memory in program order. x86 guarantees that, but ARM, such as the Pi,
+may reorder them without memory barriers, which pure Python cannot issue.
+On ARM readers take the lock as well, which orders the accesses.
+
+Requires Python 3.8 for multiprocessing.shared_memory.
+"""
+
+import marshal
+import os
+import platform
+import struct
+from multiprocessing import Lock
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Tuple, Union
+
+EMPTY = 0
+INT = 1
+FLOAT = 2
+BLOB = 3
+
+NAME_SIZE = 52
+SEQ = struct.Struct("=Q")
+META = struct.Struct(f"=BBH{NAME_SIZE}s")
+HEADER_SIZE = SEQ.size + META.size
+INT_VALUE = struct.Struct("=q")
+FLOAT_VALUE = struct.Struct("=d")
+# Stores may be seen out of order by other cores without barriers
+WEAKLY_ORDERED = platform.machine().lower().startswith(("arm", "aarch"))
+
+
+class SharedDatastore:
+    def __init__(self, dbg: Callable, num_slots: int, blob_size: int):
+        self.dbg = dbg
+        self.num_slots = num_slots
+        self.blob_size = blob_size
+        self.slot_size = HEADER_SIZE + blob_size
+        self.shm = SharedMemory(create=True,
+                                size=num_slots * self.slot_size)
+        self.buf = self.shm.buf  # New shared memory is zeroed, all EMPTY
+        self.write_lock = Lock()
+        self.owner_pid = os.getpid()  # Only the creator unlinks the memory
+        # Key -> slot index, local to each process
+        self.index = {}
+        self.torn_read_count = 0
+        self.locked_reads = WEAKLY_ORDERED
+
+    def store(self, key: str, data):
+        encoded = self.encode(data)
+        if encoded is None:
+            self.dbg("datastore_error",
+                     "Cannot store {} in shared memory: {}",
+                     [key, data.__class__])
+            return
+        kind, payload = encoded
+        with self.write_lock:
+            slot = self.index.get(key)
+            if slot is None:
+                slot = self.scan_slots(key)
+            if slot is None:
+                slot = self.allocate_slot(key)
+                if slot is None:
+                    return
+            offset = slot * self.slot_size
+            seq = SEQ.unpack_from(self.buf, offset)[0]
+            SEQ.pack_into(self.buf, offset, seq + 1)
+            META.pack_into(self.buf, offset + SEQ.size,
+                           True, kind, len(payload), key.encode())
+            start = offset + HEADER_SIZE
+            self.buf[start:start + len(payload)] = payload
+            SEQ.pack_into(self.buf, offset, seq + 2)
+
+    def is_fresh(self, key: str) -> bool:
+        slot = self.find_slot(key)
+        if slot is None:
+            return False
+        return bool(self.buf[slot * self.slot_size + SEQ.size])
+
+    def get(self, key: str):
+        """Get a value without marking it as unfresh
+        """
+        slot = self.find_slot(key)
+        if slot is None:
+            self.dbg("datastore_event", "Page for {} was empty", [key])
+            return None
+        if self.locked_reads:
+            with self.write_lock:
+                return self.read_slot(slot)
+        return self.read_slot(slot)
+
+    def use(self, key: str):
+        """Get a value and mark it as unfresh/used
+        """
+        slot = self.find_slot(key)
+        if slot is None:
+            self.dbg("datastore_error",
+                     "Cannot mark unfresh, key {} not found",
+                     [key])
+            return None
+        with self.write_lock:
+            # No writer can change the slot between reading and marking it
+            data = self.read_slot(slot)
+            self.buf[slot * self.slot_size + SEQ.size] = False
+        return data
+
+    def read_slot(self, slot: int):
+        offset = slot * self.slot_size
+        while True:
+            seq = SEQ.unpack_from(self.buf, offset)[0]
+            if seq % 2 == 1:
+                self.torn_read_count += 1
+                continue  # Being written
+            _, kind, length, _ = META.unpack_from(self.buf, offset + SEQ.size)
+            start = offset + HEADER_SIZE
+            payload = bytes(self.buf[start:start + length])
+            if SEQ.unpack_from(self.buf, offset)[0] == seq:
+                return self.decode(kind, payload)
+            self.torn_read_count += 1
+
+    def find_slot(self, key: str) -> Union[int, None]:
+        slot = self.index.get(key)
+        if slot is not None:
+            return slot
+        # May have been allocated by another process
+        with self.write_lock:
+            return self.scan_slots(key)
+
+    def scan_slots(self, key: str) -> Union[int, None]:
+        """Find the slot named key, call with the write lock held
+        """
+        name = key.encode()
+        for slot in range(self.num_slots):
+            offset = slot * self.slot_size + SEQ.size
+            _, kind, _, slot_name = META.unpack_from(self.buf, offset)
+            if kind != EMPTY and slot_name.rstrip(b"\0") == name:
+                self.index[key] = slot
+                return slot
+        return None
+
+    def allocate_slot(self, key: str) -> Union[int, None]:
+        """Find an empty slot for a new key, call with the write lock held
+        """
+        if len(key.encode()) > NAME_SIZE:
+            self.dbg("datastore_error",
+                     "Shared datastore key {} is longer than {} bytes",
+                     [key, NAME_SIZE])
+            return None
+        for slot in range(self.num_slots):
+            offset = slot * self.slot_size + SEQ.size
+            if META.unpack_from(self.buf, offset)[1] == EMPTY:
+                self.dbg("datastore_event", "Adding new shared key: {}",
+                         [key])
+                self.index[key] = slot
+                return slot
+        self.dbg("datastore_error",
+                 "No free shared datastore slot for {}", [key])
+        return None
+
+    def encode(self, data) -> Union[Tuple[int, bytes], None]:
+        if type(data) is int and -2**63 <= data < 2**63:
+            return INT, INT_VALUE.pack(data)
+        if type(data) is float:
+            return FLOAT, FLOAT_VALUE.pack(data)
+        try:
+            payload = marshal.dumps(data)
+        except ValueError:
+            return None
+        if len(payload) > self.blob_size:
+            self.dbg("datastore_error",
+                     "Value of {} bytes is larger than shared slots of {}",
+                     [len(payload), self.blob_size])
+            return None
+        return BLOB, payload
+
+    def decode(self, kind: int, payload: bytes):
+        if kind == INT:
+            return INT_VALUE.unpack(payload)[0]
+        if kind == FLOAT:
+            return FLOAT_VALUE.unpack(payload)[0]
+        if kind == BLOB:
+            return marshal.loads(payload)
+        return None
+
+    def terminate(self):
+        self.dump()
+        self.buf.release()
+        self.shm.close()
+        if os.getpid() == self.owner_pid:
+            self.shm.unlink()
+
+    def dump(self):
+        with self.write_lock:
+            for slot in range(self.num_slots):
+                offset = slot * self.slot_size + SEQ.size
+                _, kind, _, name = META.unpack_from(self.buf, offset)
+                if kind != EMPTY:
+                    self.dbg("datastore_dump", "k: {} v: {}",
+                             [name.rstrip(b"\0").decode(),
+                              self.read_slot(slot)])
+        if self.torn_read_count > 0:
+            self.dbg("datastore_dump",
+                     "Shared datastore retried {} reads during writes",
+                     [self.torn_read_count])
@@ -2,6 +2,7 @@
 """
 
 from enum import Enum
+from sys import intern
 from typing import Callable, List, Union
 
 
@@ -22,34 +23,99 @@ class TaskPriority(Enum):
     low = 1
 
 
+# Registry of interned task type names, indexed by task type id
+task_type_ids = {}
+task_type_names = []
+
+
+def task_type_id(task_type: str) -> int:
+    """Get the small integer id for a task type, registering it if new
+    """
+    type_id = task_type_ids.get(task_type)
+    if type_id is None:
+        type_id = len(task_type_names)
+        task_type_names.append(intern(task_type))
+        task_type_ids[task_type] = type_id
+    return type_id
+
+
 class Task:
     """The task class and associated code for using and passing tasks
 
     The Task object is one that defines a action or event on the robot
     raspberry pi or the surface unit raspberry pi
+
+    The task type is stored as an interned id so Nodes can dispatch on an
+    int, and val_list is stored as a tuple.
     """
+    __slots__ = ("type_id", "priority", "val_list", "deadline",
+                 "scheduled_time", "trace")
 
     def __init__(self, task_type: str,
                  priority: TaskPriority,
-                 val_list: list):
-        self.task_type = task_type
+                 val_list: list,
+                 deadline: float = None):
+        self.type_id = task_type_id(task_type)
         self.priority = priority
-        self.val_list = val_list
+        self.val_list = tuple(val_list)
+        # Optional monotonic() time by which the task should run, earliest
+        # goes first
+        self.deadline = deadline
+        self.scheduled_time = None  # monotonic() time, set when queued
+        self.trace = None  # TraceContext of the sample that caused the task
+
+    @property
+    def task_type(self) -> str:
+        return task_type_names[self.type_id]
 
     def __eq__(self, other):
         return (
             (self.__class__ == other.__class__) and
-            (self.task_type == other.task_type) and
+            (self.type_id == other.type_id) and
             (self.priority == other.priority) and
             (self.val_list == other.val_list)
         )
 
     def __repr__(self):
         return "Task: type: {}, priority: {}, val_list: {}".format(
-            self.task_type, self.priority, self.val_list)
+            self.task_type, self.priority, list(self.val_list))
 
 
 SomeTasks = Union[None, Task, List]
 TaskHandler = Callable[[Task], SomeTasks]
 TaskSource = Callable[[], SomeTasks]
 TaskScheduler = Callable[[SomeTasks], None]
+
+
+class TaskProducer:
+    """A TaskSource that a Node calls only when it is due
+
+    A producer with a period is called every period_s seconds. A producer
+    with a trigger_key is called when fresh data is stored under that key.
+    With both, fresh data triggers it early and the period is the longest
+    time between calls. Plain TaskSources in an endpoint's task_producers
+    are given the Node's default period.
+    """
+
+    def __init__(self, handler: TaskSource,
+                 period_s: float = None,
+                 trigger_key: str = None):
+        self.handler = handler
+        self.period_s = period_s
+        self.trigger_key = trigger_key
+        self.next_time = 0.0  # Periodic producers are due immediately
+
+    def due(self, now: float, published_keys: set) -> bool:
+        if self.trigger_key is not None and self.trigger_key in published_keys:
+            return True
+        return self.period_s is not None and now >= self.next_time
+
+    def produce(self, now: float) -> SomeTasks:
+        if self.period_s is not None:
+            # Catch up without bursting if calls fell behind
+            self.next_time = max(self.next_time + self.period_s, now)
+        return self.handler()
+
+    def __repr__(self):
+        return "TaskProducer: {} every {} s, trigger: {}".format(
+            self.handler.__qualname__, self.period_s, self.trigger_key)
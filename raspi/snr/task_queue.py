@@ -0,0 +1,282 @@
+"""Multi-level priority queue of Tasks for a Node
+
+Each TaskPriority level has its own FIFO deque, so enqueue and dequeue are
+O(1) per level. Tasks given a deadline are kept in a per level heap and are
+served earliest-deadline-first ahead of the FIFO tasks of the same level.
+
+Tasks that have waited longer than their level's aging period are promoted
+to the tail of the next higher level, or into its deadline heap if they have
+a deadline. Promoted tasks never overtake tasks already queued at the higher
+level, so a steady stream of normal priority tasks cannot starve low priority
+work. Nothing is promoted into the top level, so motor commands never queue
+behind aged GUI or telemetry work. The top level is kept short by coalescing
+motor setpoints instead.
+
+Task types listed in coalesce_keys are coalesced: a new task with the same
+task_type and key fields as a queued task replaces it in place, keeping the
+older task's position in the queue and the time it was queued.
+
+The queue holds at most max_len tasks. When it is full, each priority level
+follows its drop policy:
+    drop_oldest: drop the oldest task of the same level to make room
+    reject: reject the new task
+    never_drop: accept the task, dropping the oldest task of the lowest
+        drop_oldest level if there is one
+"""
+
+import heapq
+from collections import deque
+from itertools import count
+from time import monotonic
+from typing import Callable, Iterator, List, Union
+
+from snr.task import Task, TaskPriority, task_type_id
+
+# Levels from first served to last served
+PRIORITY_ORDER = sorted(TaskPriority, key=lambda p: p.value, reverse=True)
+
+DROP_OLDEST = "drop_oldest"
+REJECT = "reject"
+NEVER_DROP = "never_drop"
+
+
+class QueueEntry:
+    """Position of a task in the queue, allows replacing it in place
+    """
+    __slots__ = ("task", "key", "queued_time")
+
+    def __init__(self, task: Task, key: Union[tuple, None],
+                 queued_time: float):
+        self.task = task
+        self.key = key
+        # When the entry was queued, kept when its task is superseded
+        self.queued_time = queued_time
+
+
+class TaskQueue:
+    def __init__(self, dbg: Callable, aging_s: dict,
+                 coalesce_keys: dict,
+                 max_len: int, backpressure_len: int,
+                 drop_policies: dict):
+        self.dbg = dbg
+        self.max_len = max_len
+        # Queue length at which producers should hold back new work
+        self.backpressure_len = backpressure_len
+        self.drop_policies = drop_policies  # priority name -> drop policy
+        # Total seconds waited before promotion out of a level, by name
+        self.aging_s = aging_s
+        # Task type id -> indices of val_list that identify superseded tasks
+        self.coalesce_keys = {task_type_id(task_type): fields
+                              for task_type, fields in coalesce_keys.items()}
+        # Coalescing key -> entry of the queued task with that key
+        self.coalesce_index = {}
+        self.coalesced_counts = {}
+        self.fifo = {p: deque() for p in TaskPriority}
+        self.deadlines = {p: [] for p in TaskPriority}
+        # Breaks ties between equal deadlines in scheduling order
+        self.sequence = count()
+        self.length = 0
+
+        self.promoted_count = 0
+        self.missed_deadline_count = 0
+        self.high_water_mark = 0
+        self.dropped_counts = {p.name: 0 for p in TaskPriority}
+        self.rejected_counts = {p.name: 0 for p in TaskPriority}
+
+    def push(self, t: Task) -> bool:
+        """Add a task to the level for its priority
+        Returns False if the task was not queued
+        """
+        if t.priority not in self.fifo:
+            self.dbg("schedule", "Cannot schedule task with priority: {}",
+                     [t.priority])
+            return False
+        t.scheduled_time = monotonic()
+
+        key = self.coalesce_key(t)
+        if key is not None:
+            entry = self.coalesce_index.get(key)
+            if entry is not None and entry.task.priority == t.priority:
+                # Supersede the queued task without changing its position
+                entry.task = t
+                self.coalesced_counts[t.task_type] = (
+                    self.coalesced_counts.get(t.task_type, 0) + 1)
+                return True
+
+        if self.length >= self.max_len and not self.make_room(t):
+            self.rejected_counts[t.priority.name] += 1
+            self.dbg("schedule_warning",
+                     "Task queue full, rejected {}", [t.task_type])
+            return False
+
+        entry = QueueEntry(t, key, t.scheduled_time)
+        if key is not None:
+            self.coalesce_index[key] = entry
+        if t.deadline is None:
+            self.fifo[t.priority].append(entry)
+        else:
+            heapq.heappush(self.deadlines[t.priority],
+                           (t.deadline, next(self.sequence), entry))
+        self.length += 1
+        self.high_water_mark = max(self.high_water_mark, self.length)
+        return True
+
+    def make_room(self, t: Task) -> bool:
+        """Apply the drop policy for a task pushed onto a full queue
+        Returns whether the task should be accepted
+        """
+        policy = self.drop_policies.get(t.priority.name, REJECT)
+        if policy == DROP_OLDEST:
+            return self.drop_oldest(t.priority)
+        if policy == NEVER_DROP:
+            for p in reversed(PRIORITY_ORDER):
+                if (self.drop_policies.get(p.name) == DROP_OLDEST and
+                        self.drop_oldest(p)):
+                    break
+            # Accepted even if nothing could be dropped
+            return True
+        return False
+
+    def drop_oldest(self, priority: TaskPriority) -> bool:
+        level = self.fifo[priority]
+        if not level:
+            return False
+        t = self.remove(level.popleft())
+        self.dropped_counts[priority.name] += 1
+        self.dbg("schedule_warning",
+                 "Task queue full, dropped oldest {} task {}",
+                 [priority.name, t.task_type])
+        return True
+
+    def backpressured(self) -> bool:
+        """Whether producers should hold back new work
+        """
+        return self.length >= self.backpressure_len
+
+    def coalesce_key(self, t: Task) -> Union[tuple, None]:
+        fields = self.coalesce_keys.get(t.type_id)
+        if fields is None:
+            return None
+        try:
+            return (t.type_id,) + tuple(t.val_list[i] for i in fields)
+        except (IndexError, TypeError):
+            # Task does not have the key fields, never coalesce it
+            return None
+
+    def pop(self) -> Union[Task, None]:
+        """Remove and return the next task to execute
+        """
+        now = monotonic()
+        self.age(now)
+        for p in PRIORITY_ORDER:
+            heap = self.deadlines[p]
+            if heap:
+                deadline, _, entry = heapq.heappop(heap)
+                if deadline < now:
+                    self.missed_deadline_count += 1
+                    self.dbg("schedule_warning",
+                             "Task {} missed deadline by {:6.3f} ms",
+                             [entry.task.task_type, (now - deadline) * 1000])
+                return self.remove(entry)
+            level = self.fifo[p]
+            if level:
+                return self.remove(level.popleft())
+        return None
+
+    def pop_type(self, type_id: int) -> List[Task]:
+        """Remove and return every queued task of a type, in queue order
+        """
+        tasks = []
+        for p in PRIORITY_ORDER:
+            heap = self.deadlines[p]
+            if any(entry.task.type_id == type_id for _, _, entry in heap):
+                keep = []
+                for item in sorted(heap, key=lambda item: item[:2]):
+                    if item[2].task.type_id == type_id:
+                        tasks.append(self.remove(item[2]))
+                    else:
+                        keep.append(item)
+                self.deadlines[p] = keep  # Sorted, so still a heap
+
+            level = self.fifo[p]
+            if any(entry.task.type_id == type_id for entry in level):
+                keep = deque()
+                for entry in level:
+                    if entry.task.type_id == type_id:
+                        tasks.append(self.remove(entry))
+                    else:
+                        keep.append(entry)
+                self.fifo[p] = keep
+        return tasks
+
+    def remove(self, entry: QueueEntry) -> Task:
+        """Account for an entry taken off a level and return its task
+        """
+        self.length -= 1
+        if entry.key is not None:
+            del self.coalesce_index[entry.key]
+        return entry.task
+
+    def age(self, now: float):
+        """Promote the oldest task of each level if it has waited too long
+
+        Only the head of each FIFO is checked since it is the oldest entry
+        in its level. Coalescing keeps an entry's queued_time, so a head
+        that keeps being superseded still ages. The head of each deadline
+        heap is checked too, it runs before the rest of the heap anyway.
+
+        Levels are aged from highest to lowest, skipping the top level, so
+        a task is promoted at most one level per call. A promoted entry's
+        queued_time is reset, so it waits out the aging period of its new
+        level before it is promoted again.
+        """
+        levels = PRIORITY_ORDER[1:]
+        for higher, lower in zip(levels, levels[1:]):
+            aging_s = self.aging_s.get(lower.name)
+            if aging_s is None:
+                continue
+            level = self.fifo[lower]
+            if level and now - level[0].queued_time > aging_s:
+                entry = level.popleft()
+                entry.queued_time = now
+                self.fifo[higher].append(entry)
+                self.count_promoted(entry, lower, higher)
+            heap = self.deadlines[lower]
+            if heap and now - heap[0][2].queued_time > aging_s:
+                item = heapq.heappop(heap)
+                item[2].queued_time = now
+                heapq.heappush(self.deadlines[higher], item)
+                self.count_promoted(item[2], lower, higher)
+
+    def count_promoted(self, entry: QueueEntry,
+                       lower: TaskPriority, higher: TaskPriority):
+        self.promoted_count += 1
+        self.dbg("schedule_event",
+                 "Promoted aged {} task {} to {}",
+                 [lower.name, entry.task.task_type, higher.name])
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self) -> Iterator[Task]:
+        """Iterate over queued tasks, roughly in the order they will run
+        """
+        for p in PRIORITY_ORDER:
+            for _, _, entry in sorted(self.deadlines[p],
+                                      key=lambda item: item[:2]):
+                yield entry.task
+            for entry in self.fifo[p]:
+                yield entry.task
+
+    def dump(self):
+        self.dbg("schedule",
+                 "Task queue promoted {} aged tasks, {} missed deadlines",
+                 [self.promoted_count, self.missed_deadline_count])
+        self.dbg("schedule",
+                 "Task queue high water mark {} of {}, dropped {}, rejected {}",
+                 [self.high_water_mark, self.max_len,
+                  self.dropped_counts, self.rejected_counts])
+        for task_type, count in self.coalesced_counts.items():
+            self.dbg("schedule",
+                     "Coalesced {} superseded {} tasks",
+                     [count, task_type])
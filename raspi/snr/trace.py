@@ -0,0 +1,78 @@
+"""Trace contexts for measuring latency across Nodes
+
+A TraceContext is created where data originates, such as a controller
+sample, and travels with that data through the datastore, sockets and tasks.
+Each hop records the time since the previous hop, and the final hop also
+records the total time since the data originated, in the Node's profiler
+under "trace:<hop>".
+
+Timestamps are wall clock time() so they can be compared between topside and
+the robot. Hops that cross the network are only as accurate as the clock
+synchronization between the two machines.
+"""
+
+from time import time
+from typing import Tuple, Union
+
+from snr.profiler import Profiler
+
+
+class TraceContext:
+    """Sequence id and timing for one sample, immutable
+
+    hop() returns a new context so tasks sharing a trace are unaffected.
+    """
+    __slots__ = ("seq", "origin", "last")
+
+    def __init__(self, seq: int, origin: float, last: float = None):
+        self.seq = seq
+        self.origin = origin  # When the sample was taken
+        self.last = origin if last is None else last  # Time of latest hop
+
+    def hop(self, profiler: Union[Profiler, None],
+            name: str) -> "TraceContext":
+        """Record the time since the previous hop as name
+        """
+        now = time()
+        if profiler is not None:
+            profiler.log_latency(f"trace:{name}", now - self.last)
+        return TraceContext(self.seq, self.origin, now)
+
+    def end(self, profiler: Union[Profiler, None], name: str):
+        """Record the last hop and the total latency since the origin
+        """
+        now = time()
+        if profiler is not None:
+            profiler.log_latency(f"trace:{name}", now - self.last)
+            profiler.log_latency("trace:total", now - self.origin)
+
+    def to_dict(self) -> dict:
+        return {"seq": self.seq, "origin": self.origin, "last": self.last}
+
+    @classmethod
+    def from_dict(cls, d: Union[dict, None]) -> Union["TraceContext", None]:
+        if not isinstance(d, dict):
+            return None
+        try:
+            return cls(d["seq"], d["origin"], d["last"])
+        except KeyError:
+            return None
+
+    def __repr__(self):
+        return "TraceContext: seq: {}, age: {:6.3f} ms".format(
+            self.seq, (time() - self.origin) * 1000)
+
+
+def wrap(data, trace: Union[TraceContext, None]) -> dict:
+    """Envelope sent over sockets when tracing is enabled
+    """
+    if trace is None:
+        return {"data": data, "trace": None}
+    return {"data": data, "trace": trace.to_dict()}
+
+
+def unwrap(envelope) -> Tuple[object, Union[TraceContext, None]]:
+    if not isinstance(envelope, dict) or "data" not in envelope:
+        # Sent by a server without tracing enabled
+        return envelope, None
+    return envelope["data"], TraceContext.from_dict(envelope.get("trace"))
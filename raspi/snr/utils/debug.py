@@ -1,51 +1,287 @@
-from multiprocessing import JoinableQueue
+import os
 import queue
-from threading import Thread
-from time import sleep
-from typing import Union
+import sys
+from collections import deque
+from multiprocessing import Queue
+from operator import itemgetter
+from threading import Event, Thread, get_ident
+from time import monotonic, time
+from typing import Tuple, Union
 
 import settings
+from snr.utils.debug_log import DebugLog, snapshot, split_args
+from snr.utils.flight_recorder import FlightRecorder
 
-SLEEP_TIME = 0.001
+# Most lines taken from the queue for one write
+MAX_BATCH_LINES = 1024
 
 
 class Debugger:
-    def __init__(self):
-        self.q = JoinableQueue()
+    def __init__(self, role: str = "node"):
+        # (channel, args, time(), thread id, pid) of debug() calls waiting to
+        # be formatted and written
+        self.q = deque()
+        self.lines_queued = Event()  # Set when q may have lines
+
+        # Processes forked from this one, such as ProcEndpoints, cannot use
+        # the printing thread. Their calls are sent to this process through
+        # process_q with a sequence number per process.
+        self.pid = os.getpid()
+        self.in_child = False
+        self.process_q = Queue(settings.DEBUG_PROCESS_QUEUE_SIZE)
+        self.process_seq = 0  # Calls sent by this process, in a child
+        self.process_seqs = {}  # Pid -> last sequence number received
+        self.held = []  # Calls waiting for earlier calls from other processes
+        if hasattr(os, "register_at_fork"):  # Python 3.7+
+            os.register_at_fork(after_in_child=self.after_fork)
+        self.output = sys.stdout
+        self.channels = {}  # Channel name -> Channel
+        self.log = None
+        if settings.DEBUG_LOGGING:
+            self.log = DebugLog(settings.DEBUG_LOG_DIRECTORY, role,
+                                settings.DEBUG_LOG_SEGMENT_BYTES,
+                                settings.DEBUG_LOG_MAX_SEGMENTS)
+        self.log_error_count = 0
+        self.recorder = None
+        if settings.DEBUG_FLIGHT_RECORDER_SIZE > 0:
+            self.recorder = FlightRecorder(settings.DEBUG_LOG_DIRECTORY, role,
+                                           settings.DEBUG_FLIGHT_RECORDER_SIZE)
+
+        # Lines waiting to be written
+        self.buffer = []
+        self.buffered_bytes = 0
+        self.last_flush_time = monotonic()
+
+        self.dropped_count = 0  # Lines not queued because the queue was full
+        self.written_count = 0
+        self.write_count = 0
+        self.max_batch = 0  # Most lines found queued at once
 
         self.terminate_flag = False
-        self.printing_thread = Thread(target=self.threaded_method,
-                                      #   args=self.q
-                                      )
+        self.printing_thread = Thread(target=self.threaded_method)
         self.printing_thread.start()
+        self.receiving_thread = Thread(target=self.receive_process_calls,
+                                       daemon=True)
+        self.receiving_thread.start()
 
     def threaded_method(self):
-        # Loop
+        """Write queued lines until the None sentinel from join()
+
+        Blocks while there is nothing to write, then formats every line that
+        is queued at once, so formatting happens on this thread. Lines are
+        written together once DEBUG_FLUSH_BYTES are buffered or DEBUG_FLUSH_S
+        has passed.
+        """
         while not self.terminate_flag:
-            try:
-                line = self.q.get_nowait()
-                if line is not None:
-                    print(line)
-                    self.q.task_done()
-            except queue.Empty:
-                pass
-            sleep(SLEEP_TIME)
+            self.lines_queued.wait(self.wait_timeout())
+            # Cleared before taking lines, so lines queued later set it again
+            self.lines_queued.clear()
+            lines = []
+            while self.q and len(lines) < MAX_BATCH_LINES:
+                lines.append(self.q.popleft())
+            if len(lines) == MAX_BATCH_LINES:
+                self.lines_queued.set()  # More lines are left
+            self.max_batch = max(self.max_batch, len(lines))
+
+            items = [item for item in lines if item is not None]
+            if len(items) < len(lines):
+                self.terminate_flag = True
+            if self.process_seqs:
+                items = self.merge_held(items)
+            for item in items:
+                self.write(*item)
+            if (self.buffered_bytes >= settings.DEBUG_FLUSH_BYTES or
+                    self.flush_timeout() == 0):
+                self.flush()
 
         # Remaining lines
-        try:
-            line = self.q.get_nowait()
-            while line is not None:
-                print(line)
-                line = self.q.get()
-        except Exception as e:
-            print(f"{e}")
-        return
+        self.held.extend(item for item in self.q if item is not None)
+        self.q.clear()
+        self.held.sort(key=itemgetter(2))
+        for item in self.held:
+            self.write(*item)
+        if self.channel_active("debugger"):
+            self.buffer.append(
+                "[debugger]\tPrinted {} lines in {} writes, "
+                "at most {} queued, dropped {}".format(
+                    self.written_count + len(self.buffer),
+                    self.write_count + 1,
+                    self.max_batch, self.dropped_count))
+            if self.log is not None:
+                self.buffer.append(
+                    "[debugger]\tLogged {} calls to {}, {} failed".format(
+                        self.log.event_count, self.log.path_prefix,
+                        self.log_error_count))
+        self.flush()
+        if self.log is not None:
+            self.log.close()
+
+    def write(self, channel: str, args: tuple,
+              timestamp: float, thread_id: int, pid: int):
+        """Buffer a debug() call to be printed and logged
+        """
+        if settings.DEBUG_PRINTING:
+            line = format_line(channel, args)
+            self.buffer.append(line)
+            self.buffered_bytes += len(line) + 1
+        if self.log is not None:
+            try:
+                self.log.write(timestamp, pid, thread_id, channel, args)
+            except Exception:
+                self.log_error_count += 1
+
+    def flush_timeout(self) -> Union[float, None]:
+        """Seconds until buffered lines are due to be written
+
+        None while there is nothing buffered, so the writer blocks.
+        """
+        if not self.buffer:
+            return None
+        return max(self.last_flush_time + settings.DEBUG_FLUSH_S -
+                   monotonic(), 0)
+
+    def wait_timeout(self) -> Union[float, None]:
+        """Seconds until the writer has buffered or held lines to write
+        """
+        timeout = self.flush_timeout()
+        if self.held and (timeout is None or
+                          timeout > settings.DEBUG_PROCESS_MERGE_S):
+            return settings.DEBUG_PROCESS_MERGE_S
+        return timeout
+
+    def merge_held(self, items: list) -> list:
+        """Calls at least DEBUG_PROCESS_MERGE_S old, in time order
+
+        Calls from other processes arrive after a delay, so newer calls are
+        held until calls made before them by any process have arrived.
+        """
+        self.held.extend(items)
+        self.held.sort(key=itemgetter(2))
+        cutoff = time() - settings.DEBUG_PROCESS_MERGE_S
+        count = 0
+        while count < len(self.held) and self.held[count][2] <= cutoff:
+            count += 1
+        ready = self.held[:count]
+        del self.held[:count]
+        return ready
+
+    def flush(self):
+        if self.log is not None:
+            self.log.flush()
+        if self.buffer:
+            self.output.write("\n".join(self.buffer) + "\n")
+            self.output.flush()
+            self.written_count += len(self.buffer)
+            self.write_count += 1
+            self.buffer = []
+            self.buffered_bytes = 0
+        self.last_flush_time = monotonic()
 
     def join(self):
-        self.q.join()
-        self.terminate_flag = True
+        """Write every queued line and stop the writer
+        """
+        for handle in list(self.channels.values()):
+            if handle.limiter is not None:
+                handle.limiter.summarize(monotonic())
+        self.process_q.put(None)
+        self.receiving_thread.join()
+        self.q.append(None)
+        self.lines_queued.set()
         self.printing_thread.join()
 
+    def put(self, channel: str, args: tuple):
+        """Queue a debug() call without blocking the caller
+
+        The arguments are formatted later by the printing thread, so the
+        list of values is copied first, see snapshot(). Inlines enqueue(),
+        this runs for every call.
+        """
+        if self.pid != os.getpid():
+            # Forked without register_at_fork() calling after_fork()
+            self.after_fork()
+        if self.in_child:
+            self.put_process(channel, args)
+            return
+        if len(self.q) >= settings.DEBUG_QUEUE_SIZE:
+            self.dropped_count += 1
+            return
+        self.q.append((channel, snapshot(args), time(), get_ident(),
+                       self.pid))
+        if not self.lines_queued.is_set():
+            self.lines_queued.set()
+
+    def enqueue(self, item: tuple):
+        if len(self.q) >= settings.DEBUG_QUEUE_SIZE:
+            self.dropped_count += 1
+            return
+        self.q.append(item)
+        if not self.lines_queued.is_set():
+            self.lines_queued.set()
+
+    def after_fork(self):
+        """Send debug() calls made in a forked process to its parent
+
+        Called by os.register_at_fork() on Python 3.7+, otherwise by the
+        first call queued after the pid changed.
+        """
+        self.in_child = True
+        self.pid = os.getpid()
+        self.process_seq = 0
+        if self.recorder is not None:
+            self.recorder.events.clear()  # Calls made by the parent
+
+    def put_process(self, channel: str, args: tuple):
+        """Send a debug() call from a child process to the printing thread
+
+        The call is handed to the queue's feeder thread, so the caller does
+        not block. Values are reduced to plain values, as they are logged,
+        so they can be pickled.
+        """
+        template, values = split_args(args)
+        args = values if template is None else (template, values)
+        self.process_seq += 1
+        try:
+            self.process_q.put_nowait((self.process_seq, channel, args,
+                                       time(), get_ident(), self.pid))
+        except queue.Full:
+            pass  # Seen as a gap in the sequence numbers by the parent
+
+    def receive_process_calls(self):
+        """Queue calls sent by child processes, until join()
+        """
+        while True:
+            item = self.process_q.get()
+            if item is None:
+                return
+            seq, channel, args, timestamp, thread_id, pid = item
+            last_seq = self.process_seqs.get(pid, 0)
+            if seq > last_seq + 1:
+                self.dropped_count += seq - last_seq - 1
+            self.process_seqs[pid] = seq
+            self.enqueue((channel, args, timestamp, thread_id, pid))
+
+    def channel(self, name: str) -> "Channel":
+        """Handle for debugging on one channel, see Channel
+        """
+        handle = self.channels.get(name)
+        if handle is None:
+            limiter = None
+            if (name in settings.DEBUG_RATE_LIMITS or
+                    name in settings.DEBUG_SAMPLE_EVERY):
+                limiter = RateLimiter(self, name,
+                                      settings.DEBUG_RATE_LIMITS.get(name),
+                                      settings.DEBUG_SAMPLE_EVERY.get(name, 1))
+            events = None
+            if self.recorder is not None:
+                events = self.recorder.events
+            handle = Channel(self, name,
+                             (settings.DEBUG_PRINTING or
+                              settings.DEBUG_LOGGING) and
+                             self.channel_active(name),
+                             limiter, events)
+            self.channels[name] = handle
+        return handle
+
     def debug(self, channel: str, *args: Union[list,  str]):
         """Debugging print and logging functions
 
@@ -64,9 +300,12 @@ class Debugger:
         [channel] object.__repr__()
         [channel] message with brackets: list, thing_to_format.__repr__()
 
-        By formatting once inside debug(), format() is only called if
-        printing is turned on. Remember to include [ ] around the items
-        to be formatted.
+        Messages are formatted by the printing thread, and only if the
+        channel is turned on. Remember to include [ ] around the items
+        to be formatted. The list is copied when debug() is called, but
+        not the objects in it, which are printed as they are when the
+        printing thread formats them.
+        Code that debugs often should keep a handle from channel().
 
         Note that one iteration of this code spawned a separte thread for every
         debug() call. The printing system call could not keep up and threads
@@ -76,29 +315,23 @@ class Debugger:
         """
 
         # TODO: Use settings.ROLE for per client and server debugging?
-        if(settings.DEBUG_PRINTING and self.channel_active(channel)):
-            n = len(args)
-            # Print message to console
-            if n == 1:
-                s = "[{}]\t\t{}".format(channel,
-                                        args[0])
-                self.q.put(s)
-                # print(s)
-            elif n == 2:
-                message = str(args[0])
-                s = "[{}]\t{}".format(channel,
-                                      message.format(*args[1]))
-                self.q.put(s)
-                # print(s)
-            elif 2 > 1:
-                message = str(args[0])
-                s = "[{}]\t{}".format(channel,
-                                      message.format(*args[1:]))
-                self.q.put(s)
-                # print(s)
-        if(settings.DEBUG_LOGGING and channel_active(channel)):
-            # TODO: Output stuff to a log file
-            pass
+        handle = self.channels.get(channel)
+        if handle is None:
+            handle = self.channel(channel)
+        if handle.active:
+            handle.emit(args)
+
+    def install_dump_handlers(self):
+        """Dump the flight recorder on crashes and signals, see FlightRecorder
+        """
+        if self.recorder is not None:
+            self.recorder.install()
+
+    def dump_flight_recorder(self, reason: str):
+        """Write the most recent debug() calls to disk, if they are recorded
+        """
+        if self.recorder is not None:
+            self.recorder.dump(reason)
 
     def channel_active(self, channel: str) -> bool:
         """Whether to print or log for a debug channel
@@ -109,3 +342,119 @@ class Debugger:
             val = settings.DEBUG_CHANNELS[channel]
             return val
         return True  # default for unknown channels
+
+
+class Channel:
+    """Debugging handle for one channel, from Debugger.channel()
+
+    Whether the channel is turned on is looked up once, so a disabled
+    channel costs one call that checks active. While the flight recorder is
+    on, calls on every channel are also recorded, turned on or not. Hot
+    paths can check active themselves before building arguments:
+        log = debugger.channel("serial_verbose")
+        if log.active:
+            log("Read {} bytes", [len(data)])
+    """
+    __slots__ = ("debugger", "name", "enabled", "limiter", "events",
+                 "active")
+
+    def __init__(self, debugger: Debugger, name: str, enabled: bool,
+                 limiter: "RateLimiter" = None, events: deque = None):
+        self.debugger = debugger
+        self.name = name
+        self.enabled = enabled  # Whether calls are printed or logged
+        self.limiter = limiter
+        self.events = events  # Flight recorder ring, if calls are recorded
+        # Whether calls are printed, logged or recorded
+        self.active = enabled or events is not None
+
+    def __call__(self, *args: Union[list, str]):
+        if self.active:
+            self.emit(args)
+
+    def emit(self, args: tuple):
+        if self.events is not None:
+            # Formatted only if the ring is dumped
+            self.events.append((time(), get_ident(), self.name, args))
+        if self.enabled and (self.limiter is None or self.limiter.allow()):
+            self.debugger.put(self.name, args)
+
+    def __repr__(self):
+        return f"Debug channel {self.name}: {self.enabled}"
+
+
+class RateLimiter:
+    """Bounds how many calls on a channel are printed and logged
+
+    Only 1 in sample_every calls is considered, then a token bucket allows
+    rate calls per second on average, with bursts of up to burst calls.
+    Suppressed calls are counted and reported on the channel at most every
+    DEBUG_SUPPRESSED_SUMMARY_S seconds, and when the Debugger is joined.
+
+    Counts are not locked, so calls from several threads at once may be
+    miscounted by a few.
+    """
+
+    def __init__(self, debugger: Debugger, name: str,
+                 rate_limit: Union[Tuple[float, float], None],
+                 sample_every: int):
+        self.debugger = debugger
+        self.name = name
+        self.rate = None
+        self.burst = 0.0
+        if rate_limit is not None:
+            self.rate, self.burst = rate_limit
+        self.tokens = self.burst
+        self.sample_every = max(int(sample_every), 1)
+        self.call_count = 0
+        self.suppressed_count = 0
+        self.total_suppressed = 0
+        self.last_time = monotonic()
+        self.last_summary_time = self.last_time
+
+    def allow(self) -> bool:
+        self.call_count += 1
+        now = monotonic()
+        allowed = self.call_count % self.sample_every == 0
+        if allowed and self.rate is not None:
+            self.tokens = min(self.tokens +
+                              (now - self.last_time) * self.rate,
+                              self.burst)
+            self.last_time = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+            else:
+                allowed = False
+        if not allowed:
+            self.suppressed_count += 1
+        if (self.suppressed_count and now - self.last_summary_time >=
+                settings.DEBUG_SUPPRESSED_SUMMARY_S):
+            self.summarize(now)
+        return allowed
+
+    def summarize(self, now: float):
+        """Report calls suppressed since the last summary
+        """
+        if self.suppressed_count:
+            self.debugger.put(self.name,
+                              ("Suppressed {} messages in {:.1f} s",
+                               [self.suppressed_count,
+                                now - self.last_summary_time]))
+            self.total_suppressed += self.suppressed_count
+        self.suppressed_count = 0
+        self.last_summary_time = now
+
+
+def format_line(channel: str, args: Tuple) -> str:
+    """Format a debug() call as a printed line
+    """
+    try:
+        n = len(args)
+        if n == 1:
+            return "[{}]\t\t{}".format(channel, args[0])
+        if n == 2:
+            return "[{}]\t{}".format(channel, str(args[0]).format(*args[1]))
+        return "[{}]\t{}".format(channel, str(args[0]).format(*args[1:]))
+    except Exception as error:
+        return "[{}]\tCould not format {}: {}".format(
+            channel, args, error.__repr__())
@@ -0,0 +1,243 @@
+"""Binary log file of debug() calls, written when DEBUG_LOGGING is on
+
+The Debugger's printing thread hands each debug() call to DebugLog.write(),
+so encoding and file writes stay off the calling thread. Calls are stored
+unformatted, and can be rendered and filtered later with
+debug_log_viewer.py.
+
+Segment layout:
+    header: magic, wall clock time() when it was opened, node role
+    records: type, channel id, template id, timestamp, pid, thread id,
+        length, payload
+
+CHANNEL and TEMPLATE records name an id the first time it is used in a
+segment, so every segment can be read on its own. EVENT records hold one
+debug() call: the time() it was made, the process and thread that made it
+and its arguments encoded with marshal. Arguments marshal cannot encode are
+stored as str(). Template 0 is used for debug() calls with a single object.
+
+Segments rotate once they reach segment_size bytes. Only the newest
+max_segments segments of a run are kept.
+"""
+
+import marshal
+import mmap
+import os
+import struct
+from glob import glob
+from time import strftime, time
+from typing import Iterator, List, Tuple
+
+LOG_MAGIC = b"SNRDBG01"
+LOG_EXTENSION = ".snrdbg"
+
+CHANNEL = 1
+TEMPLATE = 2
+EVENT = 3
+
+HEADER = struct.Struct("=8sdH")  # Magic, time(), role length
+RECORD = struct.Struct("=BHIdIQI")
+OBJECT_TEMPLATE = 0
+PLAIN_TYPES = (int, float, str, bool, bytes, type(None))
+# Mutable containers, copied by snapshot() without their contents
+CONTAINER_TYPES = frozenset([list, dict, set, bytearray])
+
+# timestamp, role, pid, thread id, channel, template, args
+Event = Tuple[float, str, int, int, str, str, tuple]
+
+
+class DebugLog:
+    def __init__(self, directory: str, role: str,
+                 segment_size: int, max_segments: int, kind: str = "debug"):
+        self.role = role
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        os.makedirs(directory, exist_ok=True)
+        self.path_prefix = os.path.join(directory, "{}_{}_{}".format(
+            role, kind, strftime("%Y%m%d-%H%M%S")))
+
+        self.channel_ids = {}  # Channel -> id, stable across segments
+        self.template_ids = {}  # Template -> id, stable across segments
+        self.segments = []  # Paths of segments kept, oldest first
+        self.segment_count = 0
+        self.file = None
+        self.size = 0
+        self.written_channels = set()  # Ids defined in this segment
+        self.written_templates = set()
+        self.event_count = 0
+
+    def write(self, timestamp: float, pid: int, thread_id: int,
+              channel: str, args: tuple):
+        """Log one debug() call, from the printing thread only
+        """
+        template, values = split_args(args)
+        payload = marshal.dumps(values)
+        if self.file is None or self.size >= self.segment_size:
+            self.open_segment()
+
+        channel_id = self.channel_ids.get(channel)
+        if channel_id is None:
+            channel_id = len(self.channel_ids)
+            self.channel_ids[channel] = channel_id
+        if channel_id not in self.written_channels:
+            self.write_record(CHANNEL, channel_id, 0, timestamp, 0, 0,
+                              channel.encode())
+            self.written_channels.add(channel_id)
+
+        template_id = OBJECT_TEMPLATE
+        if template is not None:
+            template_id = self.template_ids.get(template)
+            if template_id is None:
+                template_id = len(self.template_ids) + 1
+                self.template_ids[template] = template_id
+            if template_id not in self.written_templates:
+                self.write_record(TEMPLATE, 0, template_id, timestamp, 0, 0,
+                                  template.encode())
+                self.written_templates.add(template_id)
+
+        self.write_record(EVENT, channel_id, template_id, timestamp,
+                          pid, thread_id, payload)
+        self.event_count += 1
+
+    def write_record(self, record_type: int, channel_id: int,
+                     template_id: int, timestamp: float, pid: int,
+                     thread_id: int, payload: bytes):
+        self.file.write(RECORD.pack(record_type, channel_id, template_id,
+                                    timestamp, pid, thread_id, len(payload)))
+        self.file.write(payload)
+        self.size += RECORD.size + len(payload)
+
+    def open_segment(self):
+        self.close()
+        path = "{}_{:04d}{}".format(self.path_prefix, self.segment_count,
+                                    LOG_EXTENSION)
+        # Written in large blocks, flushed with the printed lines
+        self.file = open(path, "wb", buffering=64 * 1024)
+        role = self.role.encode()
+        self.file.write(HEADER.pack(LOG_MAGIC, time(), len(role)) + role)
+        self.size = HEADER.size + len(role)
+        self.written_channels = set()
+        self.written_templates = set()
+        self.segments.append(path)
+        self.segment_count += 1
+        while len(self.segments) > self.max_segments:
+            old_path = self.segments.pop(0)
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def split_args(args: tuple) -> Tuple[str, tuple]:
+    """Template and values of debug() arguments, as debug() formats them
+    """
+    if len(args) == 1:
+        return None, (plain(args[0]),)
+    if len(args) == 2:
+        values = args[1]
+    else:
+        values = args[1:]
+    return str(args[0]), tuple(plain(value) for value in values)
+
+
+def snapshot(args: tuple) -> tuple:
+    """debug() arguments to be formatted later by the printing thread
+
+    A shallow copy: the list of values, or a single list, dict, set or
+    bytearray argument, is copied so changing it after the call does not
+    change what is printed. Everything else is kept by reference and
+    formatted as it is when printed.
+    """
+    if len(args) == 2:
+        values = args[1]
+        if type(values) is list:
+            return args[0], tuple(values)
+        return args[0], copied(values)
+    if len(args) == 1:
+        if type(args[0]) in CONTAINER_TYPES:
+            return (args[0].copy(),)
+        return args
+    return tuple(map(copied, args))
+
+
+def copied(value):
+    """Shallow copy of a mutable container, other values as they are
+    """
+    if type(value) in CONTAINER_TYPES:
+        return value.copy()
+    return value
+
+
+def plain(value):
+    """Value as stored in the log, str() of types marshal cannot encode
+    """
+    if type(value) in PLAIN_TYPES:
+        return value
+    return str(value)
+
+
+def read_debug_log(path: str) -> Iterator[Event]:
+    """Lazily iterate the debug() calls logged in one segment
+
+    The segment is memory mapped, so records are only read as they are
+    iterated.
+    """
+    channels = {}
+    templates = {OBJECT_TEMPLATE: None}
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < HEADER.size:
+            return  # Opened, but nothing was flushed to it
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        magic, _, role_len = HEADER.unpack_from(data, 0)
+        if magic != LOG_MAGIC:
+            raise ValueError(f"{path} is not a debug log")
+        offset = HEADER.size
+        role = data[offset:offset + role_len].decode()
+        offset += role_len
+        end = len(data)
+        while offset + RECORD.size <= end:
+            (record_type, channel_id, template_id, timestamp,
+             pid, thread_id, length) = RECORD.unpack_from(data, offset)
+            start = offset + RECORD.size
+            offset = start + length
+            if offset > end:
+                break  # Cut off mid record
+            payload = data[start:offset]
+            if record_type == CHANNEL:
+                channels[channel_id] = payload.decode()
+            elif record_type == TEMPLATE:
+                templates[template_id] = payload.decode()
+            elif record_type == EVENT:
+                yield (timestamp, role, pid, thread_id, channels[channel_id],
+                       templates[template_id], marshal.loads(payload))
+    finally:
+        data.close()
+
+
+def debug_log_segments(path_prefix: str) -> List[str]:
+    """Segments of a logged run in order, given the run's path prefix
+    """
+    return sorted(glob(path_prefix + "*" + LOG_EXTENSION))
+
+
+def render(event: Event) -> str:
+    """Format a logged debug() call as it would have been printed
+    """
+    _, _, _, _, channel, template, values = event
+    try:
+        if template is None:
+            return "[{}]\t\t{}".format(channel, values[0])
+        return "[{}]\t{}".format(channel, template.format(*values))
+    except Exception as error:
+        return "[{}]\tCould not format {} {}: {}".format(
+            channel, template, values, error.__repr__())
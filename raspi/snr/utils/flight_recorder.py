@@ -0,0 +1,102 @@
+"""Ring of the most recent debug() calls, dumped to disk after a crash
+
+Calls on every channel are recorded, turned on or not, so the calls
+leading up to a failure can be read afterwards even when nothing was
+printed or logged. Recording appends the call time, thread, channel and
+the arguments tuple debug() was called with to a bounded deque. Arguments
+are only converted and templates numbered when the ring is dumped.
+
+Dumps are debug log segments, read them with debug_log_viewer.py. They are
+written on unhandled exceptions, on KeyboardInterrupt from main.py, on
+SIGTERM and on SIGUSR1, which dumps without stopping the node:
+    kill -USR1 <pid>
+
+Objects in the arguments are held by reference until they leave the ring,
+so one changed after the call is dumped as it is at the time of the dump.
+"""
+
+import os
+import signal
+import sys
+import threading
+from collections import deque
+from time import time
+from typing import Union
+
+from snr.utils.debug_log import DebugLog
+
+FLIGHT_RECORDER_CHANNEL = "flight_recorder"
+
+
+class FlightRecorder:
+    def __init__(self, directory: str, role: str, size: int):
+        self.directory = directory
+        self.role = role
+        # (time(), thread id, channel, args) of the newest debug() calls
+        self.events = deque(maxlen=size)
+        self.dump_count = 0
+
+    def dump(self, reason: str) -> Union[str, None]:
+        """Write the recorded calls to a new debug log
+
+        Returns the log's path prefix, or None if it could not be written.
+        """
+        events = self.events.copy()
+        pid = os.getpid()
+        try:
+            log = DebugLog(self.directory, self.role, sys.maxsize, 1,
+                           kind="flight-{}-{}".format(
+                               pid, self.dump_count))
+            for timestamp, thread_id, channel, args in events:
+                try:
+                    log.write(timestamp, pid, thread_id, channel, args)
+                except Exception:
+                    pass  # Skip calls with arguments that cannot be logged
+            log.write(time(), pid, threading.get_ident(),
+                      FLIGHT_RECORDER_CHANNEL,
+                      ("Dumped {} calls: {}", [len(events), reason]))
+            log.close()
+        except OSError as error:
+            print("Could not dump flight recorder: {}".format(error),
+                  file=sys.stderr)
+            return None
+        self.dump_count += 1
+        print("Dumped flight recorder to {} ({})".format(
+            log.path_prefix, reason), file=sys.stderr)
+        return log.path_prefix
+
+    def install(self):
+        """Dump on unhandled exceptions, SIGTERM and SIGUSR1
+
+        Must be called from the main thread.
+        """
+        previous_excepthook = sys.excepthook
+
+        def excepthook(exc_type, value, traceback):
+            self.dump("unhandled {}: {}".format(exc_type.__name__, value))
+            previous_excepthook(exc_type, value, traceback)
+        sys.excepthook = excepthook
+
+        # Exceptions that end a Thread, from Python 3.8. AsyncEndpoint
+        # threads are started with _thread and dump by themselves
+        if hasattr(threading, "excepthook"):
+            previous_thread_hook = threading.excepthook
+
+            def thread_excepthook(args):
+                self.dump("unhandled {} in thread {}: {}".format(
+                    args.exc_type.__name__,
+                    getattr(args.thread, "name", None), args.exc_value))
+                previous_thread_hook(args)
+            threading.excepthook = thread_excepthook
+
+        signal.signal(signal.SIGTERM, self.handle_signal)
+        if hasattr(signal, "SIGUSR1"):  # Not on Windows
+            signal.signal(signal.SIGUSR1, self.handle_signal)
+
+    def handle_signal(self, signum: int, _):
+        name = signal.Signals(signum).name
+        self.dump(name)
+        if signum == signal.SIGTERM:
+            # Terminate as if the signal had not been handled
+            signal.signal(signum, signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
@@ -13,7 +13,8 @@ import settings
 def print_usage() -> None:
     """Prints a Unix style uasge message on how to start the program
     """
-    print("usage: python3 main.py (robot | topside)")
+    print("usage: python3 main.py (robot | topside) [-d] "
+          "[--replay log_prefix [--replay-speed x]]")
 
 
 def print_mode(mode: str):
@@ -1,4 +1,5 @@
 from ctypes import cdll, CDLL
+from typing import List
 
 import settings
 from snr.endpoint import Endpoint
@@ -10,7 +11,14 @@ from snr.utils import debug
 class Zybo(Endpoint):
     def __init__(self, parent: Node, name: str,
                  input: str, output: str):
+        self.task_producers = []
+        self.task_handlers = {}
+        # Registers for every queued command are written before one update
+        self.batch_task_handlers = {
+            "serial_com": self.batch_task_handler
+        }
         super().__init__(parent, name)
+        self.traced_seq = None  # Trace of the last sample written
 
         if not settings.SIMULATE_DMA:
             # https://docs.python.org/3/library/ctypes.html
@@ -57,10 +65,37 @@ class Zybo(Endpoint):
 
         return sched_list
 
+    def batch_task_handler(self, tasks: List[Task]) -> SomeTasks:
+        self.dbg("serial_verbose",
+                 "Executing {} serial com tasks in one DMA update",
+                 [len(tasks)])
+        for t in tasks:
+            self.write_register(*self.unpack_task(t))
+        self.run_dma()
+        for t in tasks:
+            if t.trace is not None and t.trace.seq != self.traced_seq:
+                self.traced_seq = t.trace.seq
+                t.trace.end(self.parent.profiler, "dma_write")
+        return None
+
+    def unpack_task(self, t: Task) -> tuple:
+        cmd = t.val_list[0]
+        reg = t.val_list[1]
+        if len(t.val_list) > 2:
+            val = t.val_list[2]
+        else:
+            val = 0
+        return cmd, reg, val
+
     def dma_write(self, cmd: str, reg: int, val: int):
+        self.write_register(cmd, reg, val)
+        self.run_dma()
+
+    def write_register(self, cmd: str, reg: int, val: int):
         self.dbg("dma_verbose", "Writing DMA: cmd: {}, reg: {}, val: {}",
               [cmd, reg, val])
 
+    def run_dma(self):
         if not settings.SIMULATE_DMA:
             self.pwm_lib.runDemo()
 
@@ -1,13 +1,14 @@
 """Simple GUI
 Provides a visual interface for the topside unit"""
 
+from threading import Event
 from typing import List
 
 import settings
 from snr.async_endpoint import AsyncEndpoint
 from snr.node import Node
 from snr.utils import debug
-from snr.task import SomeTasks, Task, TaskPriority
+from snr.task import SomeTasks, Task, TaskPriority, TaskProducer
 
 
 class SimpleGUI(AsyncEndpoint):
@@ -15,7 +16,9 @@ class SimpleGUI(AsyncEndpoint):
                  input_name: list):
         self.refresh_rate = 10
 
-        self.task_producers = [self.get_telem_data_task]
+        self.task_producers = [
+            TaskProducer(self.get_telem_data_task, 1 / self.refresh_rate)
+        ]
         self.task_handlers = {}
 
         super().__init__(parent, name,
@@ -23,6 +26,10 @@ class SimpleGUI(AsyncEndpoint):
                          self.refresh_rate)
         self.input_name = input_name
         self.datastore = self.parent.datastore
+        # Set when any displayed data is stored
+        self.data_changed = Event()
+        for input in self.input_name:
+            self.datastore.subscribe(input, self.data_changed)
 
         self.start_loop()
 
@@ -37,7 +44,7 @@ class SimpleGUI(AsyncEndpoint):
 
     def get_telem_data_task(self) -> Task:
         self.dbg("gui_verbose", "Requesting telemetry data with new task")
-        return Task("get_telem_data", TaskPriority.high, [])
+        return Task("get_telem_data", TaskPriority.low, [])
 
     def get_data(self):
         data = []
@@ -57,14 +64,20 @@ class SimpleGUI(AsyncEndpoint):
         self.update_gui()
 
     def update_gui(self):
-        # Get updated telemetry data
-        # TODO: Use page freshness abstraction to check if data is unchanged
-        data = self.get_data()
         # Please try and use as high of a timeout value as you can
         event, values = self.window.Read(timeout=self.refresh_rate)
         # if user closed the window using X or clicked Quit button
         if event is None or event == 'Quit':
             self.set_terminate_flag()
+        # Update refresh rate from GUI
+        self.dbg("gui_verbose", "UI tick_rate value: {}", [values[0]])
+        self.set_refresh_rate(values[0])
+
+        if not self.data_changed.is_set():
+            return  # Nothing new to display
+        self.data_changed.clear()
+        # Get updated telemetry data
+        data = self.get_data()
         if settings.GUI_channels["controller"]:
             self.dbg("gui_control", "Got controler info: {}", [data[0]])
             if data[0] is not None and data[0].get("stick_left_x") is not None:
@@ -80,9 +93,6 @@ class SimpleGUI(AsyncEndpoint):
                         (data[0].get("trigger_right") // 1)))
         if settings.GUI_channels["telem"]:
             self.dbg("gui_telem", "Got telem info: {}", [data[1]])
-        # Update refresh rate from GUI
-        self.dbg("gui_verbose", "UI tick_rate value: {}", [values[0]])
-        self.set_refresh_rate(values[0])
 
     def set_refresh_rate(self, rate):
         self.dbg("gui_verbose",
@@ -0,0 +1,124 @@
+# Stress test and benchmark of the Datastore under concurrent access
+# Run from this directory: python3 datastore_stress.py
+
+import sys
+import timeit
+from threading import Thread
+
+sys.path.insert(0, "../../raspi")
+
+from snr.datastore import Datastore  # noqa: E402
+
+WRITERS = 4
+READERS = 8
+WRITES = 20000
+KEYS = ["controls_data", "telemetry_data", "throttle", "motors"]
+OPS = 200000
+
+
+def dbg(channel: str, s: str, args: list = []):
+    return
+
+
+class LegacyPage:
+    def __init__(self, data):
+        self.fresh = True
+        self.data = data
+
+
+class LegacyDatastore:
+    """Datastore as it was before synchronization"""
+
+    def __init__(self):
+        self.database = {}
+
+    def store(self, key: str, data):
+        d = self.database
+        try:
+            d[key + "_previous"] = d[key]
+        except KeyError:
+            pass
+        d[key] = LegacyPage(data)
+        self.database = d
+
+    def get(self, key: str):
+        page = self.database.get(key)
+        if page is None:
+            return None
+        return page.data
+
+    def use(self, key: str):
+        try:
+            self.database[key].fresh = False
+        except KeyError:
+            pass
+        return self.get(key)
+
+
+def stress() -> int:
+    """Writers store (writer, n, n) tuples, readers check both halves match
+    Returns the number of torn or out of order reads seen
+    """
+    datastore = Datastore(dbg)
+    errors = []
+    done = []
+
+    def write(writer: int):
+        for n in range(WRITES):
+            for key in KEYS:
+                datastore.store(key, (writer, n, n))
+
+    def read():
+        last_seen = {}
+        while not done:
+            for key in KEYS:
+                data = datastore.use(key) if key == KEYS[0] \
+                    else datastore.get(key)
+                if data is None:
+                    continue
+                writer, a, b = data
+                if a != b or a < last_seen.get((key, writer), -1):
+                    errors.append(data)
+                last_seen[(key, writer)] = a
+
+    readers = [Thread(target=read) for _ in range(READERS)]
+    writers = [Thread(target=write, args=(i,)) for i in range(WRITERS)]
+    for t in readers + writers:
+        t.start()
+    for t in writers:
+        t.join()
+    done.append(True)
+    for t in readers:
+        t.join()
+
+    # Every writer's last store must be visible for one of the keys
+    final = {datastore.get(key)[1] for key in KEYS}
+    if final != {WRITES - 1}:
+        errors.append(final)
+    return len(errors)
+
+
+def bench(datastore, name: str):
+    store_s = timeit.timeit(lambda: datastore.store("controls_data", 1),
+                            number=OPS)
+    get_s = timeit.timeit(lambda: datastore.get("controls_data"), number=OPS)
+    use_s = timeit.timeit(lambda: datastore.use("controls_data"), number=OPS)
+    print("{}:\tstore {:6.3f} us, get {:6.3f} us, use {:6.3f} us".format(
+        name, store_s / OPS * 1e6, get_s / OPS * 1e6, use_s / OPS * 1e6))
+
+
+def main():
+    errors = stress()
+    print("Stress test: {} writers, {} readers, {} stores: {} errors".format(
+        WRITERS, READERS, WRITERS * WRITES * len(KEYS), errors))
+    legacy = LegacyDatastore()
+    datastore = Datastore(dbg)
+    for key in KEYS:
+        legacy.store(key, 0)
+        datastore.store(key, 0)
+    bench(legacy, "legacy")
+    bench(datastore, "locked")
+
+
+if __name__ == "__main__":
+    main()
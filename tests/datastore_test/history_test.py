@@ -0,0 +1,42 @@
+# Checks that storing a non-numeric value to a numeric history key leaves
+# the values already held intact, once the history has wrapped around
+# Run from this directory: python3 history_test.py
+
+import sys
+
+sys.path.insert(0, "../../raspi")
+
+from snr.datastore import Datastore  # noqa: E402
+
+CAPACITY = 4
+KEY = "depth"
+
+
+def main():
+    errors = []
+
+    def dbg(channel: str, s: str, args: list = []):
+        errors.append(channel)
+
+    datastore = Datastore(dbg, {KEY: CAPACITY}, [KEY])
+    # Wrap around, so the next append overwrites the oldest entry
+    for i in range(CAPACITY + 2):
+        datastore.store(KEY, float(i))
+    before = datastore.history(KEY, CAPACITY)
+
+    datastore.store(KEY, "not a number")
+    after = datastore.history(KEY, CAPACITY)
+
+    assert "datastore_error" in errors, "Rejected value was not reported"
+    assert after == before, "History changed: {} != {}".format(after,
+                                                               before)
+    assert [seq for _, seq, _ in after] == list(range(2, CAPACITY + 2))
+    assert datastore.use(KEY) == "not a number"  # Still stored as a page
+
+    datastore.store(KEY, 10.0)
+    assert datastore.history(KEY, 1)[0][2] == 10.0
+    print("Numeric history kept {} entries intact".format(len(after)))
+
+
+if __name__ == "__main__":
+    main()
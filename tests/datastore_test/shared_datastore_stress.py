@@ -0,0 +1,62 @@
+# Stress test of the shared memory datastore across processes
+# Run from this directory: python3 shared_datastore_stress.py
+
+import sys
+import timeit
+from multiprocessing import Process
+
+sys.path.insert(0, "../../raspi")
+
+from snr.shared_datastore import SharedDatastore  # noqa: E402
+
+WRITERS = 2
+WRITES = 50000
+OPS = 100000
+
+
+def dbg(channel: str, s: str, args: list = []):
+    if channel.endswith("error"):
+        print(s.format(*args))
+
+
+def write(datastore: SharedDatastore, writer: int):
+    for n in range(WRITES):
+        datastore.store("detections", (writer, n, [n] * 8, n))
+        datastore.store(f"writer_{writer}_count", n)
+
+
+def main():
+    datastore = SharedDatastore(dbg, 16, 256)
+    writers = [Process(target=write, args=(datastore, i))
+               for i in range(WRITERS)]
+    for p in writers:
+        p.start()
+
+    reads = 0
+    errors = 0
+    while any(p.is_alive() for p in writers):
+        data = datastore.use("detections")
+        if data is None:
+            continue
+        writer, a, boxes, b = data
+        reads += 1
+        if a != b or boxes != [a] * 8:
+            errors += 1
+    for p in writers:
+        p.join()
+
+    counts = [datastore.get(f"writer_{i}_count") for i in range(WRITERS)]
+    print("{} writer processes, {} reads: {} torn reads returned, "
+          "{} retried".format(WRITERS, reads, errors,
+                              datastore.torn_read_count))
+    print("Final counts {}, expected {}".format(counts, WRITES - 1))
+
+    store_s = timeit.timeit(lambda: datastore.store("motors", 50), number=OPS)
+    get_s = timeit.timeit(lambda: datastore.get("motors"), number=OPS)
+    print("store {:6.3f} us, get {:6.3f} us".format(
+        store_s / OPS * 1e6, get_s / OPS * 1e6))
+    datastore.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# Microbenchmark of debug() calls on disabled and enabled channels
+# Run from this directory: python3 debug_bench.py
+
+import io
+import sys
+import time
+import timeit
+from threading import Event
+
+sys.path.insert(0, "../../raspi")
+
+import settings  # noqa: E402
+from snr.utils.debug import Debugger  # noqa: E402
+
+CALLS = 20000
+REPEAT = 5  # Fastest of these runs is printed, the others are noise
+ARGS = [3, 1, 127]
+
+
+def legacy_debug(channel: str, *args):
+    """debug() as it was, formatting on the caller's thread, not queued"""
+    if settings.DEBUG_PRINTING and settings.DEBUG_CHANNELS.get(channel, True):
+        message = str(args[0])
+        return "[{}]\t{}".format(channel, message.format(*args[1]))
+
+
+def main():
+    settings.DEBUG_QUEUE_SIZE = CALLS * REPEAT * 4
+    recorder_size = settings.DEBUG_FLIGHT_RECORDER_SIZE
+    for recorded, enabled in [(False, False), (True, False),
+                              (False, True), (True, True)]:
+        # Recorded: the flight recorder is on, as it is by default
+        settings.DEBUG_FLIGHT_RECORDER_SIZE = recorder_size if recorded else 0
+        settings.DEBUG_CHANNELS["bench"] = enabled
+        debugger = Debugger()
+        debugger.output = io.StringIO()
+        # Hold the printing thread, waiting on the event replaced here, so
+        # only the calling thread is timed, even on a single core
+        time.sleep(0.1)
+        lines_queued = debugger.lines_queued
+        debugger.lines_queued = Event()
+        dbg = debugger.debug
+        log = debugger.channel("bench")
+        cases = [
+            ("legacy format", lambda: legacy_debug("bench", "cmd: {}, {}, {}",
+                                                   ARGS)),
+            ("debug()", lambda: dbg("bench", "cmd: {}, {}, {}", ARGS)),
+            ("channel", lambda: log("cmd: {}, {}, {}", ARGS)),
+            ("active check", lambda: log.active and
+             log("cmd: {}, {}, {}", ARGS)),
+        ]
+        for name, call in cases:
+            runtime = min(timeit.repeat(call, number=CALLS, repeat=REPEAT))
+            print("{}{} {}:\t{:6.3f} us per call".format(
+                "enabled" if enabled else "disabled",
+                ", recorded" if recorded else "", name,
+                runtime / CALLS * 1000000))
+        debugger.lines_queued = lines_queued
+        debugger.join()
+        if enabled and not recorded:
+            print("Lines written {}, dropped {}".format(
+                debugger.written_count, debugger.dropped_count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# CPU used by a topside and robot Node pair under each Node runtime
+# Run from this directory: python3 node_cpu_bench.py [seconds]
+# Controls run from the simulated controller through the sockets link to
+# simulated serial motor writes, so no hardware is needed.
+# Compare against the base commit by running it before and after a change.
+
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, "../../raspi")
+
+import settings  # noqa: E402
+
+DURATION_S = 5.0
+RUNTIMES = ["threaded", "asyncio"]
+
+
+def run(runtime: str, duration: float, port: int):
+    settings.USE_ASYNCIO_NODE = runtime == "asyncio"
+    settings.SIMULATE_INPUT = True
+    settings.SIMULATE_SERIAL = True
+    settings.DEBUG_PRINTING = False
+    settings.ENABLE_PROFILING = False
+
+    from robot_controls import RobotControlsFactory
+    from snr.asyncio_node import AsyncioNode
+    from snr.comms.serial.factory import SerialFactory
+    from snr.comms.sockets.factory import EthernetLink
+    from snr.io.controller.factory import ControllerFactory
+    from snr.node import Node
+    from snr.utils.debug import Debugger
+
+    node_class = AsyncioNode if settings.USE_ASYNCIO_NODE else Node
+    link = EthernetLink(port, settings.CONTROLS_DATA_NAME)
+    debugger = Debugger()
+    topside = node_class(debugger, "topside", "debug",
+                         [link.server,
+                          ControllerFactory(settings.CONTROLS_DATA_NAME)])
+    threading.Thread(target=topside.loop, daemon=True).start()
+    robot_components = [link.client,
+                        RobotControlsFactory(settings.CONTROLS_DATA_NAME,
+                                             "thruster_data")]
+    try:
+        import serial  # noqa: F401
+        robot_components.append(
+            SerialFactory("motor_data", "sensor_data", ""))
+    except ImportError:
+        print("pyserial is not installed, running without the serial link")
+    robot = node_class(debugger, "robot", "debug", robot_components)
+    threading.Thread(target=robot.loop, daemon=True).start()
+
+    # Skip start up
+    time.sleep(1.0)
+    start_cpu = time.process_time()
+    start = time.monotonic()
+    max_threads = 0
+    while time.monotonic() - start < duration:
+        max_threads = max(max_threads, count_threads())
+        time.sleep(0.1)
+    cpu = time.process_time() - start_cpu
+    wall = time.monotonic() - start
+    switches = resource.getrusage(resource.RUSAGE_SELF)
+    print("{}:\t{:6.3f} s CPU in {:5.2f} s ({:5.1f} %), {} threads, "
+          "{} voluntary context switches".format(
+              runtime, cpu, wall, cpu / wall * 100, max_threads,
+              switches.ru_nvcsw))
+    sys.stdout.flush()
+    robot.set_terminate_flag()
+    topside.set_terminate_flag()
+    time.sleep(0.5)
+    debugger.join()
+    os._exit(0)
+
+
+def count_threads() -> int:
+    """Threads of this process, including endpoints started with _thread
+    """
+    try:
+        return len(os.listdir("/proc/self/task"))
+    except OSError:
+        # Not Linux, misses threads not started by threading
+        return threading.active_count()
+
+
+def main():
+    duration = DURATION_S
+    if len(sys.argv) > 1 and sys.argv[1] not in RUNTIMES:
+        duration = float(sys.argv[1])
+    if len(sys.argv) > 2:
+        run(sys.argv[2], duration, int(sys.argv[3]))
+    # Each runtime gets a fresh process
+    for i, runtime in enumerate(RUNTIMES):
+        subprocess.run([sys.executable, __file__, str(duration), runtime,
+                        str(settings.CONTROLS_SOCKETS_CONFIG.port + 20 + i)])
+
+
+if __name__ == "__main__":
+    main()
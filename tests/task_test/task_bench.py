@@ -0,0 +1,60 @@
+# Microbenchmark of Task allocation for one robot control cycle
+# Run from this directory: python3 task_bench.py
+
+import sys
+import timeit
+from sys import getsizeof
+
+sys.path.insert(0, "../../raspi")
+
+from snr.task import Task, TaskPriority  # noqa: E402
+
+NUM_MOTORS = 6
+CYCLES = 100000
+
+
+class LegacyTask:
+    """Task as it was before __slots__ and interned type ids"""
+
+    def __init__(self, task_type: str, priority: TaskPriority,
+                 val_list: list):
+        self.task_type = task_type
+        self.priority = priority
+        self.val_list = val_list
+
+
+def legacy_cycle():
+    for index in range(NUM_MOTORS):
+        t = LegacyTask("serial_com", TaskPriority.high,
+                       ["set_motor", index, 50])
+        t.task_type, t.val_list[1]
+
+
+def slots_cycle():
+    for index in range(NUM_MOTORS):
+        t = Task("serial_com", TaskPriority.high, ("set_motor", index, 50))
+        t.type_id, t.val_list[1]
+
+
+def legacy_size() -> int:
+    t = LegacyTask("serial_com", TaskPriority.high, ["set_motor", 0, 50])
+    return getsizeof(t) + getsizeof(t.__dict__) + getsizeof(t.val_list)
+
+
+def slots_size() -> int:
+    t = Task("serial_com", TaskPriority.high, ("set_motor", 0, 50))
+    return getsizeof(t) + getsizeof(t.val_list)
+
+
+def main():
+    print("Bytes per serial_com task: legacy {}, slots {}".format(
+        legacy_size(), slots_size()))
+    for name, cycle in [("legacy", legacy_cycle),
+                        ("slots", slots_cycle)]:
+        runtime = timeit.timeit(cycle, number=CYCLES)
+        print("{}:\t{:6.3f} us per control cycle".format(
+            name, runtime / CYCLES * 1000000))
+
+
+if __name__ == "__main__":
+    main()